@@ -0,0 +1,166 @@
+"""Push-based Clerk user sync: webhook verification, queueing and batched upserts."""
+
+import base64
+import datetime
+import hashlib
+import hmac
+import time
+
+import pytz
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ClerkWebhookEvent, CustomUser as User
+
+USER_EVENTS = ("user.created", "user.updated", "user.deleted")
+SIGNATURE_TOLERANCE = 300  # seconds either side of svix-timestamp
+
+
+def verify_signature(headers, body: bytes) -> bool:
+    """Check the Svix signature Clerk attaches to every webhook delivery."""
+    secret = settings.CLERK_WEBHOOK_SECRET
+    msg_id = headers.get("svix-id")
+    timestamp = headers.get("svix-timestamp")
+    signatures = headers.get("svix-signature")
+    if not (secret and msg_id and timestamp and signatures):
+        return False
+
+    try:
+        if abs(time.time() - int(timestamp)) > SIGNATURE_TOLERANCE:
+            return False
+        key = base64.b64decode(secret.removeprefix("whsec_"))
+    except ValueError:
+        return False
+
+    signed = f"{msg_id}.{timestamp}.".encode() + body
+    expected = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode()
+
+    # Header holds space separated "v1,<base64>" entries, one per active secret
+    for entry in signatures.split():
+        version, _, signature = entry.partition(",")
+        if version == "v1" and hmac.compare_digest(signature, expected):
+            return True
+    return False
+
+
+def enqueue_event(msg_id: str, event: dict) -> bool:
+    """Store a webhook for the next sync run. Returns False for non-user events."""
+    event_type = event.get("type")
+    data = event.get("data")
+    if event_type not in USER_EVENTS or not isinstance(data, dict) or not data.get("id"):
+        return False
+
+    # Svix retries reuse the message id, so a redelivery is a no-op
+    ClerkWebhookEvent.objects.get_or_create(
+        svix_id=msg_id,
+        defaults={
+            "event_type": event_type,
+            "clerk_user_id": data["id"],
+            "payload": event,
+        },
+    )
+    return True
+
+
+def _profile_fields(data: dict) -> dict:
+    emails = data.get("email_addresses") or []
+    primary = next(
+        (e for e in emails if e.get("id") == data.get("primary_email_address_id")),
+        emails[0] if emails else {},
+    )
+    last_sign_in = data.get("last_sign_in_at")
+    return {
+        "email": primary.get("email_address", ""),
+        "first_name": data.get("first_name") or "",
+        "last_name": data.get("last_name") or "",
+        "last_login": (
+            datetime.datetime.fromtimestamp(last_sign_in / 1000, tz=pytz.UTC)
+            if last_sign_in
+            else None
+        ),
+    }
+
+
+def apply_pending_events(batch_size: int = 500) -> int:
+    """Apply one batch of queued events and return how many were consumed.
+
+    Events are coalesced per user so only the newest state is written: one
+    bulk upsert for created/updated users and one deactivating deleted ones.
+    An event no newer than the last one applied to its user (a retry or late
+    delivery picked up by a later batch) is consumed without being written.
+    Rows are locked with SKIP LOCKED so concurrent runs split the queue.
+    """
+    with transaction.atomic():
+        events = list(
+            ClerkWebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        latest = {}
+        for event in events:
+            key = (event.payload.get("timestamp") or 0, event.id)
+            current = latest.get(event.clerk_user_id)
+            if current is None or key >= current[0]:
+                latest[event.clerk_user_id] = (key, event)
+
+        applied = dict(
+            User.objects.select_for_update()
+            .filter(username__in=latest, clerk_event_at__isnull=False)
+            .values_list("username", "clerk_event_at")
+        )
+
+        upserts = []
+        deleted = []
+        for clerk_user_id, ((timestamp, _), event) in latest.items():
+            if clerk_user_id in applied and timestamp <= applied[clerk_user_id]:
+                continue
+            if event.event_type == "user.deleted":
+                deleted.append(
+                    User(
+                        username=clerk_user_id,
+                        password=make_password(None),
+                        is_active=False,
+                        clerk_event_at=timestamp,
+                    )
+                )
+                continue
+            upserts.append(
+                User(
+                    username=clerk_user_id,
+                    password=make_password(None),
+                    is_active=True,
+                    clerk_event_at=timestamp,
+                    **_profile_fields(event.payload["data"]),
+                )
+            )
+
+        if upserts:
+            User.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=["username"],
+                update_fields=[
+                    "email", "first_name", "last_name", "last_login", "is_active",
+                    "clerk_event_at",
+                ],
+            )
+        if deleted:
+            # Deactivate rather than delete so order history survives. A user
+            # deleted before we saw them is kept as an inactive row, so a late
+            # update can't create them as active
+            User.objects.bulk_create(
+                deleted,
+                update_conflicts=True,
+                unique_fields=["username"],
+                update_fields=["is_active", "clerk_event_at"],
+            )
+
+        ClerkWebhookEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+            processed_at=timezone.now()
+        )
+    return len(events)
@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.clerk_sync import apply_pending_events
+from api.models import ClerkWebhookEvent
+
+
+class Command(BaseCommand):
+    help = "Apply queued Clerk webhooks to users in coalesced batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--loop",
+            type=float,
+            default=0,
+            help="Keep running, polling the queue every N seconds.",
+        )
+        parser.add_argument(
+            "--prune-days",
+            type=int,
+            default=7,
+            help="Delete processed events older than this many days.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while applied := apply_pending_events(options["batch_size"]):
+                total += applied
+            if total:
+                self.stdout.write(f"Applied {total} Clerk events.")
+
+            cutoff = timezone.now() - timedelta(days=options["prune_days"])
+            ClerkWebhookEvent.objects.filter(processed_at__lt=cutoff).delete()
+
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_clerkwebhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='clerk_event_at',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -11,6 +11,8 @@ class CustomUser(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="client")
     # make last_name nullable/optional at the model level
     last_name = models.CharField(max_length=150, blank=True, null=True)
+    # Timestamp (ms) of the last Clerk webhook applied; older deliveries are skipped
+    clerk_event_at = models.BigIntegerField(blank=True, null=True)
 
     def __str__(self):
         return self.first_name
@@ -31,3 +33,26 @@ class Address(models.Model):
 
     def __str__(self):
         return f"{self.full_name}, {self.city}, {self.state}"
+
+
+class ClerkWebhookEvent(models.Model):
+    """A verified Clerk user webhook waiting to be applied to CustomUser."""
+
+    svix_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=50)
+    clerk_user_id = models.CharField(max_length=150)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="api_clerkevent_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} for {self.clerk_user_id}"
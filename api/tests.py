@@ -1,3 +1,409 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+from unittest.mock import patch
 
-# Create your tests here.
+import rsa
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+import middlewares
+from middlewares import JWKSKeyRing, JWTAuthenticationMiddleware, VerifiedTokenCache
+
+from .clerk_sync import apply_pending_events
+from .models import ClerkWebhookEvent, CustomUser
+
+WEBHOOK_SECRET = "whsec_" + base64.b64encode(b"test-webhook-secret").decode()
+
+
+def signed_headers(body, msg_id="msg_1", secret=WEBHOOK_SECRET, timestamp=None):
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    key = base64.b64decode(secret.removeprefix("whsec_"))
+    digest = hmac.new(key, f"{msg_id}.{timestamp}.".encode() + body, hashlib.sha256)
+    return {
+        "svix-id": msg_id,
+        "svix-timestamp": timestamp,
+        "svix-signature": "v1," + base64.b64encode(digest.digest()).decode(),
+    }
+
+
+def _b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+class FakeJWKSServer:
+    """Serves a static JWKS on localhost and counts how often it was fetched."""
+
+    def __init__(self, jwks, delay=0.2):
+        self.fetches = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.fetches += 1
+                time.sleep(delay)
+                body = json.dumps(jwks).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/.well-known/jwks.json"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class JWKSKeyRingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        public_key, _ = rsa.newkeys(1024)
+        cls.server = FakeJWKSServer(
+            {
+                "keys": [
+                    {
+                        "kty": "RSA",
+                        "kid": "k1",
+                        "use": "sig",
+                        "alg": "RS256",
+                        "n": _b64(public_key.n),
+                        "e": _b64(public_key.e),
+                    }
+                ]
+            }
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.fetches = 0
+
+    def _concurrent_get(self, ring, threads=20):
+        barrier = threading.Barrier(threads)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(ring.get("k1"))
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return results
+
+    def test_cold_ring_fetches_once(self):
+        ring = JWKSKeyRing(self.server.url)
+        results = self._concurrent_get(ring)
+
+        self.assertEqual(self.server.fetches, 1)
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(key is results[0] for key in results))
+
+    def test_concurrent_expiries_fetch_once(self):
+        ring = JWKSKeyRing(self.server.url, ttl=60, stale_ttl=0, min_refresh_interval=0)
+        ring.get("k1")
+        self.server.fetches = 0
+        ring._fetched_at -= 120
+
+        results = self._concurrent_get(ring)
+
+        self.assertEqual(self.server.fetches, 1)
+        self.assertEqual(len(results), 20)
+
+    def test_stale_keys_served_while_refreshing(self):
+        ring = JWKSKeyRing(self.server.url, ttl=60, min_refresh_interval=0)
+        stale = ring.get("k1")
+        self.server.fetches = 0
+        ring._fetched_at -= 90
+
+        started = time.monotonic()
+        results = self._concurrent_get(ring)
+        elapsed = time.monotonic() - started
+
+        # Nobody waited on the 200ms fetch, and exactly one ran in the background
+        self.assertLess(elapsed, 0.2)
+        self.assertTrue(all(key is stale for key in results))
+        for _ in range(50):
+            if not ring._refreshing and self.server.fetches:
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.server.fetches, 1)
+        self.assertLess(time.time() - ring._fetched_at, 5)
+
+
+class VerifiedTokenCacheTests(SimpleTestCase):
+    def test_hits_and_misses(self):
+        cache = VerifiedTokenCache()
+        self.assertIsNone(cache.get("t1"))
+        cache.put("t1", time.time() + 60, CustomUser(username="u1"))
+        user = cache.get("t1")
+        self.assertEqual(user.username, "u1")
+        # A copy: per-request state never leaks into the cache
+        self.assertIsNot(user, cache.get("t1"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (2, 1, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_entry_expires_at_exp(self):
+        cache = VerifiedTokenCache()
+        exp = time.time() + 60
+        cache.put("t1", exp, CustomUser(username="u1"))
+        with patch("middlewares.time.time", return_value=exp - 1):
+            self.assertIsNotNone(cache.get("t1"))
+        with patch("middlewares.time.time", return_value=exp):
+            self.assertIsNone(cache.get("t1"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = VerifiedTokenCache(maxsize=2)
+        exp = time.time() + 60
+        for token in ("t1", "t2"):
+            cache.put(token, exp, CustomUser(username=token))
+        cache.get("t1")
+        cache.put("t3", exp, CustomUser(username="t3"))
+
+        self.assertIsNone(cache.get("t2"))
+        self.assertIsNotNone(cache.get("t1"))
+        self.assertIsNotNone(cache.get("t3"))
+        self.assertEqual(cache.stats()["size"], 2)
+
+
+def clerk_profile(first_name="Asha", email="asha@example.com"):
+    return {
+        "email_address": email,
+        "first_name": first_name,
+        "last_name": "Rao",
+        "last_login": datetime(2026, 10, 1, tzinfo=timezone.utc),
+    }
+
+
+class ClerkProfileCacheTests(TestCase):
+    def setUp(self):
+        middlewares._profile_cache.clear()
+        middlewares._profile_refreshing.clear()
+        self.auth = JWTAuthenticationMiddleware()
+
+    def fetch(self, **kwargs):
+        return patch.object(middlewares.ClerkSDK, "fetch_user_info", **kwargs)
+
+    def test_unchanged_profile_is_not_written(self):
+        info = clerk_profile()
+        user = CustomUser.objects.create(
+            username="user_1", email=info["email_address"], first_name="Asha",
+            last_name="Rao", last_login=info["last_login"],
+        )
+        with self.assertNumQueries(0):
+            self.auth._sync_user(user, info)
+
+    def test_only_changed_columns_are_written(self):
+        info = clerk_profile()
+        user = CustomUser.objects.create(
+            username="user_1", email=info["email_address"], first_name="Old",
+            last_name="Rao", last_login=info["last_login"],
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.auth._sync_user(user, info)
+        (update,) = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertIn('"first_name"', update)
+        for column in ('"email"', '"last_name"', '"last_login"', '"password"'):
+            self.assertNotIn(column, update)
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, "Asha")
+
+    def test_stale_profile_is_served_while_one_refresh_runs(self):
+        stale_at = time.time() - middlewares.CLERK_PROFILE_CACHE_TTL - 1
+        middlewares._profile_cache["user_1"] = (stale_at, clerk_profile("Old"))
+        release = threading.Event()
+
+        def slow_fetch(user_id):
+            release.wait(5)
+            return clerk_profile("New"), True
+
+        with self.fetch(side_effect=slow_fetch) as fetch:
+            for _ in range(3):
+                self.assertEqual(self.auth._get_profile("user_1")["first_name"], "Old")
+            release.set()
+            for _ in range(50):
+                if not middlewares._profile_refreshing:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(self.auth._get_profile("user_1")["first_name"], "New")
+
+    def test_failed_fetch_keeps_last_good_profile(self):
+        middlewares._profile_cache["user_1"] = (0, clerk_profile("Good"))
+        for failure in (
+            {"side_effect": KeyError("email_addresses")},
+            {"side_effect": TypeError("last_sign_in_at")},
+            {"return_value": (clerk_profile(""), False)},
+        ):
+            with self.subTest(failure=failure), self.fetch(**failure):
+                middlewares._profile_refreshing.add("user_1")
+                info = middlewares._refresh_profile("user_1")
+                self.assertEqual(info["first_name"], "Good")
+                self.assertEqual(middlewares._profile_cache["user_1"][1], info)
+                self.assertNotIn("user_1", middlewares._profile_refreshing)
+
+    def test_unexpected_error_still_allows_the_next_refresh(self):
+        middlewares._profile_refreshing.add("user_1")
+        with self.fetch(side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                middlewares._refresh_profile("user_1")
+        self.assertNotIn("user_1", middlewares._profile_refreshing)
+
+
+class TokenCacheStatsViewTests(TestCase):
+    def test_managers_only(self):
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create(username="shopper"))
+        self.assertEqual(client.get("/token-cache/stats/").status_code, 403)
+
+        client.force_authenticate(CustomUser.objects.create(username="boss", role="manager"))
+        response = client.get("/token-cache/stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.data), {"hits", "misses", "hit_rate", "size", "users", "maxsize"}
+        )
+
+
+def user_event(event_type, clerk_user_id, timestamp, first_name="Asha"):
+    return {
+        "type": event_type,
+        "timestamp": timestamp,
+        "data": {
+            "id": clerk_user_id,
+            "first_name": first_name,
+            "last_name": "Rao",
+            "primary_email_address_id": "idn_2",
+            "email_addresses": [
+                {"id": "idn_1", "email_address": "old@example.com"},
+                {"id": "idn_2", "email_address": f"{clerk_user_id}@example.com"},
+            ],
+            "last_sign_in_at": None,
+        },
+    }
+
+
+@override_settings(CLERK_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class ClerkWebhookTests(TestCase):
+    def post(self, body, **kwargs):
+        body = body if isinstance(body, bytes) else json.dumps(body).encode()
+        headers = {
+            f"HTTP_{k.upper().replace('-', '_')}": v
+            for k, v in signed_headers(body, **kwargs).items()
+        }
+        return APIClient().post(
+            "/webhooks/clerk/", body, content_type="application/json", **headers
+        )
+
+    def test_valid_signature_is_queued(self):
+        response = self.post(user_event("user.created", "user_1", 1000))
+        self.assertEqual(response.status_code, 200)
+        event = ClerkWebhookEvent.objects.get()
+        self.assertEqual(
+            (event.svix_id, event.event_type, event.clerk_user_id),
+            ("msg_1", "user.created", "user_1"),
+        )
+
+    def test_wrong_secret_is_rejected(self):
+        other = "whsec_" + base64.b64encode(b"someone-else").decode()
+        response = self.post(user_event("user.created", "user_1", 1000), secret=other)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ClerkWebhookEvent.objects.exists())
+
+    def test_stale_timestamp_is_rejected(self):
+        for offset in (-301, 301):
+            with self.subTest(offset=offset):
+                response = self.post(
+                    user_event("user.created", "user_1", 1000),
+                    timestamp=int(time.time()) + offset,
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(ClerkWebhookEvent.objects.exists())
+
+    def test_redelivery_is_queued_once(self):
+        event = user_event("user.created", "user_1", 1000)
+        for _ in range(2):
+            self.assertEqual(self.post(event, msg_id="msg_same").status_code, 200)
+        self.assertEqual(ClerkWebhookEvent.objects.count(), 1)
+
+    def test_events_for_one_user_are_coalesced(self):
+        # Delivered out of order; the newest event timestamp wins
+        self.post(user_event("user.updated", "user_1", 2000, first_name="Newer"), msg_id="m2")
+        self.post(user_event("user.created", "user_1", 1000, first_name="Old"), msg_id="m1")
+        self.post(user_event("user.created", "user_2", 1000), msg_id="m3")
+
+        with self.assertNumQueries(6):
+            # Lock the batch, lock the users, one upsert, mark processed; plus
+            # SAVEPOINT and RELEASE
+            self.assertEqual(apply_pending_events(), 3)
+        user = CustomUser.objects.get(username="user_1")
+        self.assertEqual((user.first_name, user.email), ("Newer", "user_1@example.com"))
+        self.assertTrue(user.is_active)
+        self.assertEqual(apply_pending_events(), 0)
+
+        self.post(user_event("user.deleted", "user_1", 3000), msg_id="m4")
+        self.post(user_event("user.updated", "user_1", 2500, first_name="Stale"), msg_id="m5")
+        self.assertEqual(apply_pending_events(), 2)
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertEqual(user.first_name, "Newer")
+        self.assertFalse(ClerkWebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_older_event_in_a_later_batch_is_skipped(self):
+        self.post(user_event("user.created", "user_1", 1000, first_name="First"), msg_id="m1")
+        self.assertEqual(apply_pending_events(), 1)
+        self.post(user_event("user.deleted", "user_1", 3000), msg_id="m2")
+        self.assertEqual(apply_pending_events(), 1)
+
+        # A retry of an update sent before the delete arrives late
+        self.post(user_event("user.updated", "user_1", 2000, first_name="Late"), msg_id="m3")
+        self.assertEqual(apply_pending_events(), 1)
+        user = CustomUser.objects.get(username="user_1")
+        self.assertFalse(user.is_active)
+        self.assertEqual((user.first_name, user.clerk_event_at), ("First", 3000))
+
+        self.post(user_event("user.created", "user_2", 1000, first_name="Old"), msg_id="m4")
+        self.assertEqual(apply_pending_events(), 1)
+        self.post(user_event("user.updated", "user_2", 1000, first_name="Same"), msg_id="m5")
+        self.post(user_event("user.updated", "user_2", 4000, first_name="New"), msg_id="m6")
+        self.assertEqual(apply_pending_events(), 2)
+        self.assertEqual(CustomUser.objects.get(username="user_2").first_name, "New")
+        self.assertFalse(ClerkWebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_delete_before_first_sync_is_remembered(self):
+        self.post(user_event("user.created", "user_1", 1000), msg_id="m1")
+        self.post(user_event("user.deleted", "user_1", 3000), msg_id="m2")
+        self.assertEqual(apply_pending_events(), 2)
+        self.post(user_event("user.updated", "user_1", 2000), msg_id="m3")
+        self.assertEqual(apply_pending_events(), 1)
+        self.assertFalse(CustomUser.objects.get(username="user_1").is_active)
+
+    def test_signed_non_object_is_rejected(self):
+        for body in (b"[1, 2]", b'"user.created"', b"null"):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        response = self.post({"type": "user.created", "data": [1]})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ClerkWebhookEvent.objects.exists())
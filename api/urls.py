@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import user_details,UserAddressView
+from .views import user_details,UserAddressView,ClerkWebhookView,TokenCacheStatsView
 
 urlpatterns = [
     path("role/",user_details,name = "role"),
     path('address/', UserAddressView.as_view(), name='user-address'),
+    path('webhooks/clerk/', ClerkWebhookView.as_view(), name='clerk-webhook'),
+    path('token-cache/stats/', TokenCacheStatsView.as_view(), name='token-cache-stats'),
 ]
@@ -6,6 +6,10 @@ from rest_framework.views import APIView
 from rest_framework import status, permissions
 from .models import Address
 from .serializers import AddressSerializer
+from .clerk_sync import enqueue_event, verify_signature
+from .permissions import IsManager
+from middlewares import token_cache_stats
+import json
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -44,4 +48,37 @@ class UserAddressView(APIView):
             if serializer.is_valid():
                 serializer.save(user=request.user)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ClerkWebhookView(APIView):
+    """Receives Clerk user.* webhooks and queues them for sync_clerk_events."""
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        body = request.body
+        if not verify_signature(request.headers, body):
+            return Response({"detail": "Invalid signature."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            event = json.loads(body)
+        except json.JSONDecodeError:
+            return Response({"detail": "Invalid JSON."}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(event, dict):
+            return Response(
+                {"detail": "Expected a JSON object."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        enqueue_event(request.headers["svix-id"], event)
+        return Response({"status": "queued"})
+
+
+class TokenCacheStatsView(APIView):
+    """Hit/miss counters of the verified-token cache in the process serving the request."""
+
+    permission_classes = [IsManager]
+
+    def get(self, request):
+        return Response(token_cache_stats())
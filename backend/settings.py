@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "api",
     "rest_framework",
     "corsheaders",
@@ -79,6 +80,15 @@ DATABASES = {
     }
 }
 
+# Cache
+# Set CACHE_URL to a shared backend (redis://... or pymemcache://...) in
+# production. Local memory is per process: a catalog version bump or detail
+# invalidation only reaches the worker that made the write, so with it the
+# cache TTLs below default to a few seconds of staleness instead of an hour.
+# `manage.py check --deploy` warns when production runs on local memory.
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+LOCAL_CACHE = CACHES["default"]["BACKEND"].endswith("LocMemCache")
+
 # CORS
 CORS_ALLOWED_ORIGINS = env.list("CORS_ALLOWED_ORIGINS", default=[])
 CORS_ALLOW_CREDENTIALS = True
@@ -140,9 +150,41 @@ else:
     MEDIA_URL = "/media/"
     MEDIA_ROOT = BASE_DIR / "media"
 
+# Catalog
+PRODUCT_PAGE_SIZE = env.int("PRODUCT_PAGE_SIZE", default=24)
+PRODUCT_MAX_PAGE_SIZE = env.int("PRODUCT_MAX_PAGE_SIZE", default=100)
+# Defaults are short on a per-process cache (see CACHES)
+CATALOG_CACHE_TTL = env.int("CATALOG_CACHE_TTL", default=10 if LOCAL_CACHE else 3600)
+PRODUCT_DETAIL_CACHE_TTL = env.int(
+    "PRODUCT_DETAIL_CACHE_TTL", default=10 if LOCAL_CACHE else 600
+)
+PRODUCT_STOCK_CACHE_TTL = env.int("PRODUCT_STOCK_CACHE_TTL", default=10 if LOCAL_CACHE else 30)
+PRODUCT_IMAGE_IMPORT_WORKERS = env.int("PRODUCT_IMAGE_IMPORT_WORKERS", default=4)
+# Imported image URLs are cut off above this many bytes
+PRODUCT_IMAGE_MAX_DOWNLOAD_SIZE = env.int("PRODUCT_IMAGE_MAX_DOWNLOAD_SIZE", default=20_000_000)
+# Larger catalog files go through `manage.py import_catalog`, not the HTTP endpoint
+PRODUCT_IMPORT_MAX_UPLOAD_SIZE = env.int("PRODUCT_IMPORT_MAX_UPLOAD_SIZE", default=2_000_000)
+# Processes converting images to WebP, per web/worker process; 0 converts inline
+PRODUCT_IMAGE_WORKERS = env.int("PRODUCT_IMAGE_WORKERS", default=2)
+# Longest side of stored images; larger uploads are decoded at reduced scale
+PRODUCT_IMAGE_MAX_DIMENSION = env.int("PRODUCT_IMAGE_MAX_DIMENSION", default=2400)
+# Uploads over this many pixels are rejected before decoding (48 MP phones fit)
+PRODUCT_IMAGE_MAX_PIXELS = env.int("PRODUCT_IMAGE_MAX_PIXELS", default=64_000_000)
+# Uploads above this size are spooled to temp files instead of memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = env.int("FILE_UPLOAD_MAX_MEMORY_SIZE", default=2_621_440)
+# Storefront page for a product in marketplace feeds, e.g. "https://shop.example/product/{id}"
+CATALOG_FEED_PRODUCT_URL = env("CATALOG_FEED_PRODUCT_URL", default="")
+CATALOG_FEED_CHUNK_SIZE = env.int("CATALOG_FEED_CHUNK_SIZE", default=1000)
+# Shared secret marketplaces pass as ?token= to fetch the feed; empty means managers only
+CATALOG_FEED_TOKEN = env("CATALOG_FEED_TOKEN", default="")
+
 # Default PK
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Clerk
+# Signing secret of the Clerk webhook endpoint ("whsec_..."); empty disables the endpoint
+CLERK_WEBHOOK_SECRET = env("CLERK_WEBHOOK_SECRET", default="")
+
 # Razorpay
 RAZORPAY_KEY_ID = env("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = env("RAZORPAY_KEY_SECRET")
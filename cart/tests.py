@@ -1,3 +1,74 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from product.models import Product, ProductStock
+
+from .models import Cart, CartItem
+
+
+class CartGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username="shopper")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, count):
+        """Per group of three: one fine, one hidden, one over the stock left."""
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        for i in range(count):
+            product = Product.objects.create(
+                name=f"Tee {i}",
+                description="",
+                price=Decimal("499"),
+                category="Men",
+                subcategory="Topwear",
+                show=i % 3 != 1,
+            )
+            ProductStock.objects.create(product=product, size="M", quantity=2)
+            CartItem.objects.create(
+                cart=cart, product_id=product, size="M", quantity=5 if i % 3 == 2 else 1
+            )
+        return cart
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/cart/")
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [q["sql"].split()[0] for q in queries]
+
+    def test_query_count_does_not_grow_with_cart(self):
+        self.fill_cart(3)
+        _, small = self.get()
+        CartItem.objects.all().delete()
+        self.fill_cart(30)
+        data, large = self.get()
+
+        self.assertEqual(small, large)
+        self.assertEqual(large, ["SELECT", "SELECT", "DELETE", "UPDATE"])
+        self.assertEqual(len(data["items"]), 20)
+        self.assertIn("warning", data)
+        self.assertIn("removed", data)
+        self.assertEqual({item["quantity"] for item in data["items"]}, {1, 2})
+        self.assertEqual(set(CartItem.objects.values_list("quantity", flat=True)), {1, 2})
+
+    def test_clean_cart_is_not_written(self):
+        self.fill_cart(3)
+        self.get()
+        data, queries = self.get()
+        self.assertEqual(queries, ["SELECT", "SELECT"])
+        self.assertNotIn("warning", data)
+        self.assertNotIn("removed", data)
 
-# Create your tests here.
+    def test_missing_cart_is_not_created(self):
+        data, queries = self.get()
+        self.assertEqual(data["items"], [])
+        self.assertEqual(queries, ["SELECT"])
+        self.assertFalse(Cart.objects.exists())
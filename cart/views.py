@@ -2,9 +2,18 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .serializers import CartItemSerializer
 from product.models import Product, ProductStock
 from django.shortcuts import get_object_or_404
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Least
+
+
+def stock_quantity():
+    # ProductStock.quantity for the outer CartItem's product and size
+    return ProductStock.objects.filter(
+        product=OuterRef("product_id"), size=OuterRef("size")
+    ).values("quantity")[:1]
 
 
 class CartView(APIView):
@@ -15,54 +24,45 @@ class CartView(APIView):
         return cart
 
     def get(self, request):
-        cart = self.get_cart(request.user)
-        # Prefetch related product to avoid N+1 when iterating items
-        items_qs = cart.items.select_related("product_id").all()
+        # A read: no cart is created, and rows are only written when the
+        # cart has hidden products or more than is in stock (one DELETE and
+        # one UPDATE at most, whatever the size of the cart)
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart is None:
+            return Response({"id": None, "user": request.user.pk, "items": []})
+
+        items = list(
+            CartItem.objects.filter(cart=cart)
+            .select_related("product_id")
+            .annotate(available=Coalesce(Subquery(stock_quantity()), 0))
+            .order_by("id")
+        )
+
         # Remove items for products that are not shown
-        removed = False
-        for item in list(items_qs):
-            if not item.product_id.show:
-                item.delete()
-                removed = True
-
-        # Refresh queryset after potential deletes
-        items_qs = cart.items.select_related("product_id").all()
-
-        # Check and update cart items if stock is less than cart quantity
-        updated = False
-        # Bulk fetch stocks for all (product, size) pairs to reduce queries
-        wanted = [(item.product_id_id, item.size) for item in items_qs]
-        if wanted:
-            stocks = ProductStock.objects.filter(
-                product_id__in={pid for pid, _ in wanted},
-                size__in={s for _, s in wanted},
+        hidden = [item.pk for item in items if not item.product_id.show]
+        if hidden:
+            CartItem.objects.filter(pk__in=hidden).delete()
+        items = [item for item in items if item.product_id.show]
+
+        # Clamp quantities to the stock left
+        over = [item for item in items if item.quantity > item.available]
+        if over:
+            CartItem.objects.filter(pk__in=[item.pk for item in over]).update(
+                quantity=Least(F("quantity"), Coalesce(Subquery(stock_quantity()), 0))
             )
-            # Map (product_id, size) -> stock
-            stock_map = {(s.product_id, s.size): s for s in stocks}
-        else:
-            stock_map = {}
-
-        for item in items_qs:
-            stock = stock_map.get((item.product_id_id, item.size))
-            if not stock or item.quantity > stock.quantity:
-                new_quantity = stock.quantity if stock else 0
-                if item.quantity != new_quantity:
-                    item.quantity = new_quantity
-                    item.save(update_fields=["quantity"])
-                    updated = True
-        # Reload cart with prefetch to avoid N+1 in serializer
-        cart_pref = (
-            Cart.objects.filter(pk=cart.pk)
-            .prefetch_related("items__product_id")
-            .first()
-        )
-        serializer = CartSerializer(cart_pref or cart)
-        response_data = serializer.data
-        if updated:
+            for item in over:
+                item.quantity = item.available
+
+        response_data = {
+            "id": cart.pk,
+            "user": cart.user_id,
+            "items": CartItemSerializer(items, many=True).data,
+        }
+        if over:
             response_data["warning"] = (
                 "Some cart items were updated due to limited stock."
             )
-        if removed:
+        if hidden:
             response_data["removed"] = (
                 "Some items were removed because the product is no longer available."
             )
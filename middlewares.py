@@ -1,12 +1,16 @@
+import copy
 import datetime
 import environ
+import hashlib
 import jwt
 import pytz
 import requests
+import threading
 import time
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 
-from jose import jwt as jose_jwt
+from jose import jwk, jwt as jose_jwt
 from jose.utils import base64url_decode
 import requests
 
@@ -14,7 +18,7 @@ from jwt import PyJWKClient
 from api.models import CustomUser as User
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from jose.exceptions import ExpiredSignatureError, JWTError
+from jose.exceptions import ExpiredSignatureError, JWKError, JWTError
 
 env = environ.Env()
 
@@ -22,10 +26,193 @@ CLERK_API_URL = "https://api.clerk.com/v1"
 CLERK_FRONTEND_API_URL = env("CLERK_FRONTEND_API_URL")
 CLERK_SECRET_KEY = env("CLERK_SECRET_KEY")
 
-# JWKS cache
-_jwks_cache: Dict = {}
-_jwks_cache_time: float = 0
+# JWKS key ring
 JWKS_CACHE_TTL = 300  # 5 minutes
+JWKS_REFRESH_AHEAD = 60  # start a background refresh this long before expiry
+JWKS_STALE_TTL = 300  # keep serving expired keys this long while a refresh runs
+JWKS_MIN_REFRESH_INTERVAL = 10  # unknown kids can't force refetches more often than this
+
+# Clerk profile cache: user_id -> (fetched_at, profile or None)
+_profile_cache: Dict[str, Tuple[float, Optional[Dict]]] = {}
+_profile_refreshing: set = set()
+_profile_lock = threading.Lock()
+CLERK_PROFILE_CACHE_TTL = env.int("CLERK_PROFILE_CACHE_TTL", default=300)
+CLERK_PROFILE_CACHE_SIZE = env.int("CLERK_PROFILE_CACHE_SIZE", default=10000)
+# Turn off once the Clerk webhook (api.ClerkWebhookView) keeps users in sync
+CLERK_PROFILE_PULL = env.bool("CLERK_PROFILE_PULL", default=True)
+JWT_CACHE_SIZE = env.int("JWT_CACHE_SIZE", default=10000)
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified bearer tokens, each entry expiring at the token's exp."""
+
+    def __init__(self, maxsize: int = JWT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # sha256(token) -> (exp, user_id)
+        self._tokens: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # user_id -> user row shared by all of that user's tokens
+        self._users: "OrderedDict[str, User]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[User]:
+        key = self._digest(token)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry and entry[0] > time.time() and entry[1] in self._users:
+                self._tokens.move_to_end(key)
+                self._users.move_to_end(entry[1])
+                self.hits += 1
+                # Hand out a copy so per-request relation caches don't leak between requests
+                return copy.copy(self._users[entry[1]])
+            if entry:
+                del self._tokens[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, exp: float, user: User) -> None:
+        key = self._digest(token)
+        with self._lock:
+            self._tokens[key] = (exp, user.username)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+            self._set_user(user)
+
+    def update_user(self, user: User) -> None:
+        """Replace the cached row after the user was written to the database."""
+        with self._lock:
+            if user.username in self._users:
+                self._set_user(user)
+
+    def _set_user(self, user: User) -> None:
+        self._users[user.username] = copy.copy(user)
+        self._users.move_to_end(user.username)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._tokens),
+                "users": len(self._users),
+                "maxsize": self.maxsize,
+            }
+
+
+_token_cache = VerifiedTokenCache()
+
+
+def token_cache_stats() -> Dict:
+    """Counters of this process's verified-token cache (see api.TokenCacheStatsView)."""
+    return _token_cache.stats()
+
+
+class JWKSKeyRing:
+    """Public keys parsed once and indexed by kid, refreshed single-flight.
+
+    Keys are refreshed in the background ahead of expiry; expired keys keep
+    being served for ``stale_ttl`` seconds while that refresh runs. Only a cold
+    ring, a long-stale ring or an unknown kid makes callers wait, and then all
+    of them wait on the same fetch.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        ttl: float = JWKS_CACHE_TTL,
+        refresh_ahead: float = JWKS_REFRESH_AHEAD,
+        stale_ttl: float = JWKS_STALE_TTL,
+        min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL,
+        session: Optional[requests.Session] = None,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.stale_ttl = stale_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.fetch_count = 0
+        self._session = session or requests.Session()
+        self._keys: Dict = {}
+        self._fetched_at: float = 0
+        self._attempted_at: float = 0
+        self._error: Optional[str] = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+
+    def get(self, kid: str):
+        now = time.time()
+        attempted_at = self._attempted_at
+        age = now - self._fetched_at
+        key = self._keys.get(kid)
+        # Throttles refetches while Clerk is down or a token carries a bogus kid
+        recently_attempted = now - attempted_at < self.min_refresh_interval
+
+        if key is not None and (age < self.ttl + self.stale_ttl or recently_attempted):
+            if age >= self.ttl - self.refresh_ahead and not recently_attempted:
+                self._refresh(attempted_at, wait=False)
+            return key
+
+        if not recently_attempted:
+            self._refresh(attempted_at, wait=True)
+            key = self._keys.get(kid)
+        if key is None:
+            if not self._keys and self._error:
+                raise AuthenticationFailed(f"Failed to fetch JWKS: {self._error}")
+            raise AuthenticationFailed(f"Public key not found for kid: {kid}")
+        return key
+
+    def _refresh(self, attempted_at: float, wait: bool) -> None:
+        """Start a fetch unless one is running or finished since ``attempted_at``."""
+        with self._lock:
+            if self._refreshing:
+                if wait:
+                    self._refreshed.wait_for(lambda: not self._refreshing, timeout=15)
+                return
+            if self._attempted_at != attempted_at:
+                return
+            self._refreshing = True
+
+        if wait:
+            self._fetch()
+        else:
+            threading.Thread(target=self._fetch, daemon=True).start()
+
+    def _fetch(self) -> None:
+        keys, error = None, None
+        try:
+            response = self._session.get(self.url, timeout=10)
+            response.raise_for_status()
+            keys = {
+                k["kid"]: jwk.construct(k, k.get("alg", "RS256"))
+                for k in response.json()["keys"]
+            }
+        except (requests.RequestException, ValueError, KeyError, JWKError) as e:
+            # Keep the previous keys; the next expired lookup retries
+            error = str(e)
+
+        with self._lock:
+            self.fetch_count += 1
+            self._attempted_at = time.time()
+            self._error = error
+            if keys is not None:
+                self._keys = keys
+                self._fetched_at = self._attempted_at
+            self._refreshing = False
+            self._refreshed.notify_all()
+
+
+_key_ring = JWKSKeyRing(f"{CLERK_FRONTEND_API_URL}/.well-known/jwks.json")
 
 
 class JWTAuthenticationMiddleware(BaseAuthentication):
@@ -40,32 +227,62 @@ class JWTAuthenticationMiddleware(BaseAuthentication):
             raise AuthenticationFailed("Bearer token not provided.")
 
         user = self.decode_jwt(token)
-        clerk = ClerkSDK()
-        info, found = clerk.fetch_user_info(user.username)
-
         if not user:
             return None
+        if not user.is_active:
+            raise AuthenticationFailed("User inactive or deleted.")
 
-        if found:
-            user.email = info["email_address"]
-            user.first_name = info["first_name"]
-            user.last_name = info["last_name"]
-            user.last_login = info["last_login"]
-            user.save()
+        if CLERK_PROFILE_PULL:
+            info = self._get_profile(user.username)
+            if info:
+                self._sync_user(user, info)
 
         return user, None
 
+    def _get_profile(self, user_id: str) -> Optional[Dict]:
+        """Get the Clerk profile from cache, refreshing it in the background once stale."""
+        with _profile_lock:
+            cached = _profile_cache.get(user_id)
+            stale = cached and (time.time() - cached[0]) >= CLERK_PROFILE_CACHE_TTL
+            if stale and user_id not in _profile_refreshing:
+                _profile_refreshing.add(user_id)
+                threading.Thread(
+                    target=_refresh_profile, args=(user_id,), daemon=True
+                ).start()
+
+        if cached:
+            return cached[1]
+        # First sighting of this user: fetch inline so the row gets populated
+        return _refresh_profile(user_id)
+
+    def _sync_user(self, user, info: Dict) -> None:
+        """Copy profile fields onto the user, writing only the columns that changed."""
+        values = {
+            "email": info["email_address"],
+            "first_name": info["first_name"],
+            "last_name": info["last_name"],
+            "last_login": info["last_login"],
+        }
+        changed = [field for field, value in values.items() if getattr(user, field) != value]
+        if not changed:
+            return
+
+        for field in changed:
+            setattr(user, field, values[field])
+        user.save(update_fields=changed)
+        _token_cache.update_user(user)
+
     def decode_jwt(self, token):
-        jwks = self._get_jwks()
-        header = jose_jwt.get_unverified_header(token)
+        user = _token_cache.get(token)
+        if user is not None:
+            return user
 
-        key = next((k for k in jwks["keys"] if k["kid"] == header["kid"]), None)
-        if not key:
-            # Force refresh JWKS and try once more
-            jwks = self._get_jwks(force_refresh=True)
-            key = next((k for k in jwks["keys"] if k["kid"] == header["kid"]), None)
-            if not key:
-                raise AuthenticationFailed(f"Public key not found for kid: {header['kid']}")
+        try:
+            header = jose_jwt.get_unverified_header(token)
+        except JWTError:
+            raise AuthenticationFailed("Invalid JWT token.")
+
+        key = _key_ring.get(header.get("kid"))
 
         try:
             payload = jose_jwt.decode(
@@ -84,36 +301,34 @@ class JWTAuthenticationMiddleware(BaseAuthentication):
         user_id = payload.get("sub")
         if user_id:
             user, _ = User.objects.get_or_create(username=user_id)
+            if payload.get("exp"):
+                _token_cache.put(token, payload["exp"], user)
             return user
 
         raise AuthenticationFailed("User ID not found in token.")
 
-    def _get_jwks(self, force_refresh: bool = False) -> Dict:
-        """Get JWKS with caching and automatic refresh."""
-        global _jwks_cache, _jwks_cache_time
-        
-        current_time = time.time()
-        
-        # Return cached JWKS if valid and not forcing refresh
-        if not force_refresh and _jwks_cache and (current_time - _jwks_cache_time) < JWKS_CACHE_TTL:
-            return _jwks_cache
-        
-        # Fetch fresh JWKS
-        jwks_url = f"{CLERK_FRONTEND_API_URL}/.well-known/jwks.json"
-        try:
-            response = requests.get(jwks_url, timeout=10)
-            response.raise_for_status()
-            jwks = response.json()
-            
-            # Update cache
-            _jwks_cache = jwks
-            _jwks_cache_time = current_time
-            
-            return jwks
-        except requests.RequestException as e:
-            if _jwks_cache:  # Fallback to cached version if available
-                return _jwks_cache
-            raise AuthenticationFailed(f"Failed to fetch JWKS: {str(e)}")
+
+def _refresh_profile(user_id: str) -> Optional[Dict]:
+    """Fetch a profile from Clerk and store it in the profile cache."""
+    info, found = None, False
+    try:
+        info, found = ClerkSDK().fetch_user_info(user_id)
+    except (requests.RequestException, ValueError, KeyError, IndexError, TypeError):
+        # Clerk down, or a profile we can't read (no email, never signed in)
+        pass
+    finally:
+        # Even on an unexpected error, or this user is never refreshed again
+        with _profile_lock:
+            _profile_refreshing.discard(user_id)
+            previous = _profile_cache.pop(user_id, None)
+            if not found:
+                # Keep serving the last good profile; retry after another TTL
+                info = previous[1] if previous else None
+            if len(_profile_cache) >= CLERK_PROFILE_CACHE_SIZE:
+                _profile_cache.pop(next(iter(_profile_cache)))
+            _profile_cache[user_id] = (time.time(), info)
+
+    return info
 
 
 class ClerkSDK:
@@ -121,6 +336,7 @@ class ClerkSDK:
         response = requests.get(
             f"{CLERK_API_URL}/users/{user_id}",
             headers={"Authorization": f"Bearer {CLERK_SECRET_KEY}"},
+            timeout=10,
         )
         if response.status_code == 200:
             data = response.json()
@@ -1,3 +1,90 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Address
+from product.models import Product, ProductImage
+
+from .models import Order, OrderItem
+
+
+def make_customer(username):
+    user = get_user_model().objects.create(username=username, email=f"{username}@example.com")
+    Address.objects.create(
+        user=user,
+        first_name="Asha",
+        Last_name="Rao",
+        phone_number="9999999999",
+        address_line1="12 MG Road",
+        street="MG Road",
+        city="Bengaluru",
+        state="Karnataka",
+        postal_code="560001",
+    )
+    return user
+
+
+class OrderListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer("customer")
+        cls.manager = get_user_model().objects.create(username="manager", role="manager")
+        cls.products = [
+            Product.objects.create(
+                name=f"Shirt {i}",
+                description="Cotton",
+                price=Decimal("499.00"),
+                category="Men",
+                subcategory="Topwear",
+            )
+            for i in range(2)
+        ]
+        for product in cls.products:
+            # Still converting: never the cover
+            ProductImage.objects.create(
+                product=product, image="", status=ProductImage.PROCESSING
+            )
+            ProductImage.objects.create(product=product, image=f"product_images/{product.pk}.webp")
+
+    def place_orders(self, count):
+        orders = Order.objects.bulk_create(
+            Order(user=self.customer, address=self.customer.address, total_amount=99800)
+            for _ in range(count)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, size="M", quantity=1, price=49900)
+            for order in orders
+            for product in self.products
+        )
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        for user, url in ((self.customer, "/order-list/"), (self.manager, "/all-orders/")):
+            with self.subTest(url=url):
+                Order.objects.all().delete()
+                self.place_orders(1)
+                _, one = self.get(user, url)
+                self.place_orders(99)
+                response, hundred = self.get(user, url)
+                self.assertEqual(len(response.data), 100)
+                self.assertEqual(one, hundred)
 
-# Create your tests here.
+    def test_items_show_the_cover_image(self):
+        self.place_orders(1)
+        response, _ = self.get(self.customer, "/order-list/")
+        images = [item["image"] for item in response.data[0]["items"]]
+        self.assertEqual(
+            sorted(images),
+            sorted(f"http://testserver/media/product_images/{p.pk}.webp" for p in self.products),
+        )
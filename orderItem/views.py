@@ -14,6 +14,20 @@ from api.models import Address
 from django.core.exceptions import ObjectDoesNotExist
 from product.models import ProductStock
 from django.db import transaction
+from django.db.models import Prefetch
+
+
+def order_items():
+    # Items with their product and its cover image, in one query for all orders
+    return Prefetch(
+        "items", queryset=OrderItem.objects.select_related("product__cover_image")
+    )
+
+
+def cover_image_url(request, product):
+    if product and product.cover_image:
+        return request.build_absolute_uri(product.cover_image.image.url)
+    return None
 
 
 class CreateOrderView(APIView):
@@ -180,8 +194,8 @@ class OrderListView(APIView):
         user = request.user
         orders = (
             Order.objects.filter(user=user)
-            .select_related("user", "address")
-            .prefetch_related("items__product__images")
+            .select_related("user__address")
+            .prefetch_related(order_items())
         )
         order_data = []
         for order in orders:
@@ -208,13 +222,7 @@ class OrderListView(APIView):
                             "product": item.product.name,
                             "size": item.size,
                             "quantity": item.quantity,
-                            "image": (
-                                request.build_absolute_uri(
-                                    item.product.images.first().image.url
-                                )
-                                if item.product and item.product.images.first()
-                                else None
-                            ),
+                            "image": cover_image_url(request, item.product),
                         }
                         for item in order.items.all()
                     ],
@@ -229,8 +237,8 @@ class allOrdersView(APIView):
     def get(self, request):
         orders = (
             Order.objects.all()
-            .select_related("user", "address")
-            .prefetch_related("items__product__images")
+            .select_related("user__address")
+            .prefetch_related(order_items())
         )
         order_data = []
         for order in orders:
@@ -259,13 +267,7 @@ class allOrdersView(APIView):
                             "product": item.product.name,
                             "size": item.size,
                             "quantity": item.quantity,
-                            "image": (
-                                request.build_absolute_uri(
-                                    item.product.images.first().image.url
-                                )
-                                if item.product and item.product.images.first()
-                                else None
-                            ),
+                            "image": cover_image_url(request, item.product),
                         }
                         for item in order.items.all()
                     ],
@@ -1,11 +1,17 @@
 from django.contrib import admin
-from .models import Product, ProductImage
+from .models import Product, ProductImage, ProductStock
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1
 
+class ProductStockInline(admin.TabularInline):
+    model = ProductStock
+    extra = 1
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'subcategory', 'price', 'bestseller')
-    inlines = [ProductImageInline]
+    list_display = ('name', 'category', 'subcategory', 'price', 'bestseller', 'total_stock', 'in_stock')
+    list_filter = ('in_stock',)
+    readonly_fields = ('total_stock', 'in_stock')
+    inlines = [ProductImageInline, ProductStockInline]
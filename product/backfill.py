@@ -0,0 +1,131 @@
+"""Shared driver for the resumable image backfill management commands."""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from .cache import bump_catalog_version, invalidate_product
+
+
+class Throttle:
+    """Space out work shared by several threads to at most ``rate`` units a second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_at = time.monotonic()
+
+    def wait(self, units=1):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_at)
+            self.next_at = start + units * self.interval
+        time.sleep(start - now)
+
+
+class ImageBackfillCommand(BaseCommand):
+    """Walk ``pending()`` in pk order and run ``process(pk)`` on N threads.
+
+    ``pending()`` must only match rows that still need work, so finished rows
+    drop out and an interrupted run resumes where it stopped. ``process``
+    returns the ids of the products whose cached representation changed.
+    Commands whose rows look the same before and after (a re-encode) resume
+    from resume_after() instead, and record progress in batch_done().
+    """
+
+    def pending(self):
+        raise NotImplementedError
+
+    def process(self, pk):
+        raise NotImplementedError
+
+    def resume_after(self, options):
+        """The pk to start after; 0 walks every pending row."""
+        return 0
+
+    def batch_done(self, last_pk, options):
+        """Called once every row up to ``last_pk`` has been processed."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=4,
+            help=(
+                "Concurrent images (0 runs them one by one in this thread); "
+                "encoding itself runs in the PRODUCT_IMAGE_WORKERS pool."
+            ),
+        )
+
+    def _in_thread(self, pk):
+        close_old_connections()
+        try:
+            return self.process(pk)
+        finally:
+            connection.close()
+
+    def _inline(self, pk):
+        future = Future()
+        try:
+            future.set_result(self.process(pk))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def handle(self, *args, **options):
+        pending = self.pending().order_by("pk")
+        last_pk = self.resume_after(options)
+        total = pending.filter(pk__gt=last_pk).count()
+        done = failed = 0
+        started = time.monotonic()
+
+        executor = ThreadPoolExecutor(options["threads"]) if options["threads"] else None
+        submit = (lambda pk: executor.submit(self._in_thread, pk)) if executor else self._inline
+        try:
+            while True:
+                ids = list(
+                    pending.filter(pk__gt=last_pk).values_list("pk", flat=True)[
+                        : options["batch_size"]
+                    ]
+                )
+                if not ids:
+                    break
+                last_pk = ids[-1]
+
+                product_ids = set()
+                futures = {submit(pk): pk for pk in ids}
+                for future, pk in futures.items():
+                    try:
+                        product_ids.update(future.result())
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"Image {pk} failed: {e}")
+                        continue
+                    done += 1
+
+                # Rows are written with update(), which skips the cache signals
+                for product_id in product_ids:
+                    invalidate_product(product_id, stock=False)
+                bump_catalog_version()
+                self.batch_done(last_pk, options)
+                self.stdout.write(
+                    f"{done + failed}/{total} images, {failed} failed, "
+                    f"{self.rate(done + failed, started)}."
+                )
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.stdout.write(
+            f"Backfilled {done} images, {failed} failed, {self.rate(done + failed, started)}."
+        )
+
+    @staticmethod
+    def rate(count, started):
+        return f"{count / max(time.monotonic() - started, 1e-6):.1f} images/s"
@@ -0,0 +1,152 @@
+"""Catalog caches.
+
+List responses are keyed by a global catalog version. Every change to a
+Product, ProductStock or ProductImage bumps the version (see product.signals),
+which orphans all cached responses at once. Product detail is cached per pk
+and only that pk is invalidated. Bulk writes that bypass model signals must
+call bump_catalog_version / invalidate_product themselves.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from .models import Product, ProductStock
+from .serializers import ProductReadSerializer, ProductSerializer
+
+CATALOG_VERSION_KEY = "catalog:version"
+# Bump the suffix whenever the cached detail gains or loses fields
+PRODUCT_DETAIL_KEY = "product:{pk}:detail:2"
+PRODUCT_STOCK_KEY = "product:{pk}:stock"
+
+
+def _seed_version():
+    # Seeded from the clock so a flushed cache never reissues an old version
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _seed_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, _seed_version(), timeout=None)
+
+
+def _response_key(request, version):
+    query = sorted(request.GET.lists())
+    digest = hashlib.sha256(
+        f"{request.get_host()}{request.path}?{query}".encode()
+    ).hexdigest()
+    return f"catalog:response:{version}:{digest}"
+
+
+def cached_catalog_response(request, render):
+    """Serve ``render()``'s JSON bytes from the versioned cache with a strong ETag.
+
+    A warm request with a matching If-None-Match costs two cache reads and no
+    database work.
+    """
+    key = _response_key(request, get_catalog_version())
+    entry = cache.get(key)
+    if entry is None:
+        body = render()
+        entry = (f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        cache.set(key, entry, settings.CATALOG_CACHE_TTL)
+    etag, body = entry
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # Shared caches may store it but must revalidate, which is a cheap 304
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def get_product_detail(pk):
+    """Read-through cache of the product detail representation.
+
+    The product body and images change rarely and are cached for
+    PRODUCT_DETAIL_CACHE_TTL. Stock is cached separately for the much shorter
+    PRODUCT_STOCK_CACHE_TTL so availability stays fresh. Returns None for an
+    unknown pk.
+    """
+    return get_product_details([pk]).get(pk)
+
+
+def get_product_details(pks):
+    """Batch form of get_product_detail: {pk: representation} for known pks.
+
+    One cache round trip for all keys, then one query per missing portion
+    (products, images, stock) however many pks missed.
+    """
+    keys = {}
+    for pk in pks:
+        keys[PRODUCT_DETAIL_KEY.format(pk=pk)] = ("detail", pk)
+        keys[PRODUCT_STOCK_KEY.format(pk=pk)] = ("stock", pk)
+    cached = cache.get_many(list(keys))
+    details = {}
+    stocks = {}
+    for key, value in cached.items():
+        kind, pk = keys[key]
+        (details if kind == "detail" else stocks)[pk] = value
+
+    to_cache = {}
+    missing = [pk for pk in pks if pk not in details]
+    if missing:
+        fields = [f for f in ProductSerializer.Meta.fields if f != "stock_details"]
+        rows = Product.objects.filter(pk__in=missing).values(
+            *ProductReadSerializer.columns(fields)
+        )
+        for detail in ProductReadSerializer(rows, many=True, fields=fields).data:
+            details[detail["id"]] = detail
+            to_cache[PRODUCT_DETAIL_KEY.format(pk=detail["id"])] = detail
+        if to_cache:
+            cache.set_many(to_cache, settings.PRODUCT_DETAIL_CACHE_TTL)
+
+    missing = [pk for pk in details if pk not in stocks]
+    if missing:
+        for pk in missing:
+            stocks[pk] = []
+        for row in (
+            ProductStock.objects.filter(product_id__in=missing)
+            .order_by("id")
+            .values("product_id", "id", "size", "quantity")
+        ):
+            product_id = row.pop("product_id")
+            stocks[product_id].append(row)
+        cache.set_many(
+            {PRODUCT_STOCK_KEY.format(pk=pk): stocks[pk] for pk in missing},
+            settings.PRODUCT_STOCK_CACHE_TTL,
+        )
+
+    return {
+        pk: {
+            field: stocks[pk] if field == "stock_details" else detail[field]
+            for field in ProductSerializer.Meta.fields
+        }
+        for pk, detail in details.items()
+    }
+
+
+def invalidate_product(pk, detail=True, stock=True):
+    keys = []
+    if detail:
+        keys.append(PRODUCT_DETAIL_KEY.format(pk=pk))
+    if stock:
+        keys.append(PRODUCT_STOCK_KEY.format(pk=pk))
+    cache.delete_many(keys)
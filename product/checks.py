@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Catalog invalidation only reaches every worker through a shared cache."""
+    if settings.DEBUG or not settings.LOCAL_CACHE:
+        return []
+    return [
+        Warning(
+            "The default cache is local memory, so catalog and product cache "
+            "invalidation only reaches the worker that made the write.",
+            hint="Set CACHE_URL to a Redis or memcached server shared by all workers.",
+            id="product.W001",
+        )
+    ]
@@ -0,0 +1,139 @@
+"""Streaming catalog feeds for marketplaces (NDJSON, CSV and Google Merchant XML).
+
+Visible products are read through a server-side cursor and serialized one
+chunk at a time with ProductReadSerializer (one stock and one image query per
+chunk), so memory stays flat whatever the size of the catalog.
+"""
+
+import csv
+import io
+import json
+import re
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from .models import Product, ProductStock
+from .serializers import ProductReadSerializer
+
+# format -> Content-Type
+FEED_FORMATS = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "xml": "application/xml; charset=utf-8",
+}
+FEED_CURRENCY = "INR"
+SIZES = [size for size, _ in ProductStock.SIZE_CHOICES]
+# Same columns the catalog importer reads, plus id
+CSV_COLUMNS = [
+    "id", "name", "description", "price", "category", "subcategory", "bestseller",
+    *(f"stock_{size}" for size in SIZES), "images",
+]
+# Characters XML 1.0 cannot carry even when escaped
+XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def iter_product_chunks(chunk_size=1000, base_url=""):
+    """Yield lists of serialized products, ``chunk_size`` at a time.
+
+    Relative image URLs are made absolute against ``base_url``.
+    """
+    rows = (
+        Product.objects.filter(show=True)
+        .order_by("id")
+        .values(*ProductReadSerializer.columns())
+        .iterator(chunk_size=chunk_size)
+    )
+    base_url = base_url.rstrip("/")
+
+    def absolute(url):
+        return base_url + url if url and url.startswith("/") else url
+
+    def absolute_image(image):
+        image["image"] = absolute(image["image"])
+        image["variants"] = {name: absolute(url) for name, url in image["variants"].items()}
+        if image["srcset"]:
+            image["srcset"] = ", ".join(absolute(entry) for entry in image["srcset"].split(", "))
+
+    while chunk := list(islice(rows, chunk_size)):
+        products = ProductReadSerializer(chunk, many=True).data
+        if base_url:
+            for product in products:
+                for image in product["images"]:
+                    absolute_image(image)
+                if product["cover_image"]:
+                    absolute_image(product["cover_image"])
+        yield products
+
+
+def _ndjson(chunks):
+    for products in chunks:
+        yield "".join(
+            json.dumps(product, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for product in products
+        )
+
+
+def _csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for products in chunks:
+        for product in products:
+            stock = {s["size"]: s["quantity"] for s in product["stock_details"]}
+            writer.writerow(
+                [product[column] for column in CSV_COLUMNS[:7]]
+                + [stock.get(size, "") for size in SIZES]
+                + ["|".join(i["image"] for i in product["images"] if i["image"])]
+            )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _xml_element(name, value):
+    return f"<g:{name}>{escape(XML_INVALID.sub('', str(value)))}</g:{name}>"
+
+
+def _xml(chunks):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>'
+        "<title>Catalog</title>\n"
+    )
+    link = settings.CATALOG_FEED_PRODUCT_URL
+    for products in chunks:
+        items = []
+        for product in products:
+            in_stock = any(s["quantity"] > 0 for s in product["stock_details"])
+            images = [i["image"] for i in product["images"] if i["image"]]
+            elements = [
+                _xml_element("id", product["id"]),
+                _xml_element("title", product["name"]),
+                _xml_element("description", product["description"]),
+                _xml_element("price", f"{product['price']} {FEED_CURRENCY}"),
+                _xml_element("availability", "in_stock" if in_stock else "out_of_stock"),
+                _xml_element("condition", "new"),
+                _xml_element(
+                    "product_type", f"{product['category']} > {product['subcategory']}"
+                ),
+            ]
+            if link:
+                elements.append(_xml_element("link", link.format(id=product["id"])))
+            if images:
+                elements.append(_xml_element("image_link", images[0]))
+                elements += [_xml_element("additional_image_link", i) for i in images[1:]]
+            items.append(f"<item>{''.join(elements)}</item>\n")
+        yield "".join(items)
+    yield "</channel></rss>\n"
+
+
+WRITERS = {"ndjson": _ndjson, "csv": _csv, "xml": _xml}
+
+
+def stream_feed(fmt, chunk_size=1000, base_url=""):
+    """Yield the feed in ``fmt`` as text, one piece per chunk of products."""
+    if fmt not in FEED_FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    return WRITERS[fmt](iter_product_chunks(chunk_size, base_url))
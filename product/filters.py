@@ -0,0 +1,141 @@
+"""Query-parameter filters for catalog listings.
+
+Each filter lines up with a partial index on the visible catalog (see
+Product.Meta.indexes and ProductStock.Meta.indexes).
+"""
+
+from decimal import ROUND_CEILING, ROUND_FLOOR, Decimal, InvalidOperation
+
+from django.db.models import Count, Exists, OuterRef, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Product, ProductStock
+
+BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
+# Upper bounds of the price facet's buckets; the last bucket is open-ended
+PRICE_BUCKETS = (500, 1000, 2000, 5000)
+
+
+def _choice(params, name, choices):
+    value = params.get(name)
+    if value is None:
+        return None
+    allowed = [key for key, _ in choices]
+    if value not in allowed:
+        raise ValidationError({name: f"Must be one of: {', '.join(allowed)}."})
+    return value
+
+
+def _boolean(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return BOOLEAN_VALUES[value.lower()]
+    except KeyError:
+        raise ValidationError({name: "Must be true or false."})
+
+
+def _decimal(params, name, field, rounding):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "Must be a number."})
+    # NaN, Infinity and huge exponents parse fine but fail in the database;
+    # adjusted() is the exponent of the leading digit, so no arithmetic overflows
+    if not number.is_finite() or (
+        number and number.adjusted() >= field.max_digits - field.decimal_places
+    ):
+        raise ValidationError({name: "Must be a number."})
+    # Prices never have more places than the column, so rounding towards the
+    # range keeps the comparison exact and drops tiny exponents like 1e-999999
+    return number.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=rounding)
+
+
+def filter_products(queryset, params):
+    """Narrow a Product queryset by category, subcategory, bestseller, stock, price and size."""
+    category = _choice(params, "category", Product.CATEGORY_CHOICES)
+    if category:
+        queryset = queryset.filter(category=category)
+
+    subcategory = _choice(params, "subcategory", Product.SUBCATEGORY_CHOICES)
+    if subcategory:
+        queryset = queryset.filter(subcategory=subcategory)
+
+    bestseller = _boolean(params, "bestseller")
+    if bestseller is not None:
+        queryset = queryset.filter(bestseller=bestseller)
+
+    in_stock = _boolean(params, "in_stock")
+    if in_stock is not None:
+        queryset = queryset.filter(in_stock=in_stock)
+
+    price_field = Product._meta.get_field("price")
+    min_price = _decimal(params, "min_price", price_field, ROUND_CEILING)
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+
+    max_price = _decimal(params, "max_price", price_field, ROUND_FLOOR)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    size = _choice(params, "size", ProductStock.SIZE_CHOICES)
+    if size:
+        queryset = queryset.filter(
+            Exists(
+                ProductStock.objects.filter(
+                    product=OuterRef("pk"), size=size, quantity__gt=0
+                )
+            )
+        )
+
+    return queryset
+
+
+def _price_buckets():
+    """(key, condition) per PRICE_BUCKETS range: "0-500", ..., "5000+"."""
+    buckets = []
+    lower = 0
+    for upper in PRICE_BUCKETS:
+        buckets.append((f"{lower}-{upper}", Q(price__gte=lower, price__lt=upper)))
+        lower = upper
+    buckets.append((f"{lower}+", Q(price__gte=lower)))
+    return buckets
+
+
+def facet_counts(queryset):
+    """Count products per category, subcategory, in-stock size, bestseller and price.
+
+    Every count is a conditional COUNT(DISTINCT id) in a single aggregate
+    query over ``queryset`` LEFT JOINed with ProductStock.
+    """
+    facets = {
+        "category": [(value, Q(category=value)) for value, _ in Product.CATEGORY_CHOICES],
+        "subcategory": [
+            (value, Q(subcategory=value)) for value, _ in Product.SUBCATEGORY_CHOICES
+        ],
+        "size": [
+            (value, Q(stock_details__size=value, stock_details__quantity__gt=0))
+            for value, _ in ProductStock.SIZE_CHOICES
+        ],
+        "bestseller": [("true", Q(bestseller=True)), ("false", Q(bestseller=False))],
+        "price": _price_buckets(),
+    }
+
+    aggregates = {"total": Count("id", distinct=True)}
+    aliases = {}
+    for facet, buckets in facets.items():
+        for value, condition in buckets:
+            alias = f"facet_{len(aliases)}"
+            aliases[alias] = (facet, value)
+            aggregates[alias] = Count("id", filter=condition, distinct=True)
+
+    counts = queryset.aggregate(**aggregates)
+    result = {facet: {} for facet in facets}
+    for alias, (facet, value) in aliases.items():
+        result[facet][value] = counts[alias]
+    result["total"] = counts["total"]
+    return result
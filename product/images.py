@@ -0,0 +1,587 @@
+"""Product image conversion."""
+
+import base64
+import hashlib
+import io
+import ipaddress
+import multiprocessing
+import os
+import socket
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urljoin, urlparse
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+
+_import_executor = None
+_conversion_executor = None  # (workers, ProcessPoolExecutor)
+
+
+# Responsive renditions: name -> max width in px, largest first
+VARIANTS = {"large": 1200, "medium": 600, "thumb": 200}
+VARIANT_QUALITY = 80
+# Inline blur-up placeholder: longest side in px and WebP quality (~100-300 bytes)
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
+MAX_REDIRECTS = 5
+# Temp files holding uploads and downloads until they are converted
+SPOOL_PREFIX = "product-image-"
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class ImageDownloadError(ValueError):
+    pass
+
+
+def _open(source, max_dimension=None, max_pixels=None):
+    """Open ``source`` (bytes or a file path) oriented, in RGB and bounded.
+
+    The pixel budget is checked against the header before anything is
+    decoded. Above ``max_dimension`` JPEGs are decoded straight at 1/2, 1/4
+    or 1/8 scale (draft) and other formats are shrunk with reduce() before
+    the final resample, so a full-resolution bitmap is never held.
+    """
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if max_pixels and img.width * img.height > max_pixels:
+        img.close()
+        raise ImageTooLarge(
+            f"{img.width}x{img.height} is over the {max_pixels} pixel limit."
+        )
+    if max_dimension and max(img.size) > max_dimension:
+        img.draft("RGB", (max_dimension, max_dimension))
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=2.0)
+
+    # Apply EXIF orientation (works for HEIC and all formats)
+    img = ImageOps.exif_transpose(img)
+
+    # Convert to RGB if necessary
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    return img
+
+
+def _save_webp(img, quality=85):
+    buffer = io.BytesIO()
+    img.save(buffer, format='WEBP', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _variants(img):
+    renditions = {}
+    for name, width in VARIANTS.items():
+        # Each rendition is resized from the previous (larger) one; never upscaled
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        renditions[name] = (_save_webp(img, VARIANT_QUALITY), img.width, img.height)
+    return renditions
+
+
+def _placeholder(img):
+    scale = PLACEHOLDER_SIZE / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    tiny = img.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    data = base64.b64encode(_save_webp(tiny, PLACEHOLDER_QUALITY)).decode()
+    return f"data:image/webp;base64,{data}"
+
+
+def encode_webp(source, variants=False, max_dimension=None, max_pixels=None):
+    """Decode an image (bytes or a file path) and return it re-encoded as WebP.
+
+    With ``variants`` returns ``(webp, {name: (webp, width, height)},
+    placeholder)``: the VARIANTS renditions and an inline data: URI
+    placeholder, all from the same decode. See _open for the limits. Depends
+    only on its arguments so it can run in a worker process.
+    """
+    img = _open(source, max_dimension, max_pixels)
+    webp = _save_webp(img)
+    return (webp, _variants(img), _placeholder(img)) if variants else webp
+
+
+def encode_variants(source, max_dimension=None, max_pixels=None):
+    """Only the VARIANTS renditions of an image (see encode_webp)."""
+    return _variants(_open(source, max_dimension, max_pixels))
+
+
+def encode_placeholder(source, max_dimension=None, max_pixels=None):
+    """Only the placeholder of an image (see encode_webp)."""
+    return _placeholder(_open(source, max_dimension, max_pixels))
+
+
+def encode_limits():
+    """The configured decode limits, as keyword arguments for encode_webp."""
+    return {
+        "max_dimension": settings.PRODUCT_IMAGE_MAX_DIMENSION,
+        "max_pixels": settings.PRODUCT_IMAGE_MAX_PIXELS,
+    }
+
+
+def check_image(upload):
+    """Raise ImageTooLarge, or OSError from Pillow, for an unusable upload.
+
+    Reads only the header, so it is cheap enough for the request thread.
+    """
+    max_pixels = settings.PRODUCT_IMAGE_MAX_PIXELS
+    with Image.open(upload) as img:
+        if max_pixels and img.width * img.height > max_pixels:
+            raise ImageTooLarge(
+                f"{img.width}x{img.height} is over the {max_pixels} pixel limit."
+            )
+    upload.seek(0)
+
+
+def spool_upload(upload):
+    """Bytes of a small upload, or the path of a private temp copy of a large one.
+
+    Uploads over FILE_UPLOAD_MAX_MEMORY_SIZE stay on disk end to end, so
+    neither the web nor the worker process holds them in memory. The copy
+    outlives the request (Django deletes its own temp file); discard() it
+    once converted.
+    """
+    upload.seek(0)
+    if upload.size <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        return upload.read()
+    suffix = os.path.splitext(upload.name)[1]
+    with tempfile.NamedTemporaryFile(
+        dir=settings.FILE_UPLOAD_TEMP_DIR, prefix=SPOOL_PREFIX, suffix=suffix, delete=False
+    ) as fh:
+        for chunk in upload.chunks():
+            fh.write(chunk)
+    return fh.name
+
+
+def discard(source):
+    if isinstance(source, str):
+        try:
+            os.unlink(source)
+        except FileNotFoundError:
+            pass
+
+
+def webp_name(name):
+    return f"{os.path.splitext(name)[0]}.webp"
+
+
+def convert_to_webp(image_file):
+    return ContentFile(
+        encode_webp(image_file.read(), **encode_limits()), name=webp_name(image_file.name)
+    )
+
+
+def _conversion_pool():
+    global _conversion_executor
+    workers = settings.PRODUCT_IMAGE_WORKERS
+    if _conversion_executor is None or _conversion_executor[0] != workers:
+        # spawn, not fork: the parent holds DB connections and threads
+        _conversion_executor = (
+            workers,
+            ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            ),
+        )
+    return _conversion_executor[1]
+
+
+def run_in_pool(func, *args, **kwargs):
+    """Call ``func`` in a worker process, or inline when PRODUCT_IMAGE_WORKERS is 0."""
+    global _conversion_executor
+    if not settings.PRODUCT_IMAGE_WORKERS:
+        return func(*args, **kwargs)
+    try:
+        return _conversion_pool().submit(func, *args, **kwargs).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool for the next job
+        _conversion_executor = None
+        raise
+
+
+def _thread_pool():
+    global _import_executor
+    if _import_executor is None:
+        _import_executor = ThreadPoolExecutor(
+            max_workers=settings.PRODUCT_IMAGE_IMPORT_WORKERS,
+            thread_name_prefix="product-images",
+        )
+    return _import_executor
+
+
+def is_url(source):
+    return urlparse(source).scheme in ("http", "https")
+
+
+def save_variants(image, renditions):
+    """Store renditions next to ``image.image``; returns the ProductImage.variants value."""
+    base = os.path.splitext(image.image.name)[0]
+    storage = image.image.storage
+    return {
+        name: {
+            "name": storage.save(f"{base}_{name}.webp", ContentFile(data)),
+            "width": width,
+            "height": height,
+        }
+        for name, (data, width, height) in renditions.items()
+    }
+
+
+def variant_urls(variants, storage):
+    """Return ({name: url}, srcset) for a ProductImage.variants value, narrowest first."""
+    ordered = sorted(variants.items(), key=lambda item: item[1]["width"])
+    urls = {name: storage.url(variant["name"]) for name, variant in ordered}
+    srcset = ", ".join(f"{urls[name]} {variant['width']}w" for name, variant in ordered)
+    return urls, srcset
+
+
+def content_hash(source):
+    """sha256 hex digest of an upload, bytes or a file path, read in chunks."""
+    digest = hashlib.sha256()
+    if isinstance(source, bytes):
+        digest.update(source)
+    elif isinstance(source, str):
+        with open(source, "rb") as fh:
+            while chunk := fh.read(64 * 1024):
+                digest.update(chunk)
+    else:
+        source.seek(0)
+        for chunk in source.chunks():
+            digest.update(chunk)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def delete_blob_files(blob):
+    storage = blob.image.storage
+    for name in [blob.image.name, *(v["name"] for v in blob.variants.values())]:
+        if name:
+            storage.delete(name)
+
+
+def get_or_create_blob(sha256, name, source):
+    """The ImageBlob for ``sha256``; converts and stores ``source`` only when it is new."""
+    from .models import ImageBlob
+
+    blob = ImageBlob.objects.filter(sha256=sha256).first()
+    if blob is not None:
+        return blob
+
+    webp, renditions, placeholder = run_in_pool(
+        encode_webp, source, True, **encode_limits()
+    )
+    blob = ImageBlob(sha256=sha256, placeholder=placeholder)
+    blob.image.save(webp_name(name), ContentFile(webp), save=False)
+    blob.variants = save_variants(blob, renditions)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # A concurrent upload of the same bytes got there first
+        delete_blob_files(blob)
+        blob = ImageBlob.objects.get(sha256=sha256)
+    return blob
+
+
+def attach_blob(image, blob):
+    """Point ``image`` at ``blob`` and save it as READY.
+
+    Returns False if the blob was released in the meantime.
+    """
+    from .models import ImageBlob, ProductImage
+
+    with transaction.atomic():
+        # Holding the blob row lock keeps release_blob from deleting it, and
+        # reencode_image from swapping its files, until the image is saved
+        blob = ImageBlob.objects.select_for_update().filter(pk=blob.pk).first()
+        if blob is None:
+            return False
+        image.blob = blob
+        image.image = blob.image.name
+        image.variants = blob.variants
+        image.placeholder = blob.placeholder
+        image.status = ProductImage.READY
+        image.save()
+    return True
+
+
+def store_image(image, sha256, name, source):
+    """Attach the (possibly already stored) conversion of ``source`` to ``image``."""
+    for _ in range(3):
+        if attach_blob(image, get_or_create_blob(sha256, name, source)):
+            return image
+    raise RuntimeError(f"Image blob {sha256} kept disappearing.")
+
+
+def release_blob(blob_id):
+    """Delete a blob and its files once no ProductImage refers to it."""
+    from .models import ImageBlob
+
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None or blob.images.exists():
+            return False
+        blob.delete()
+        transaction.on_commit(lambda: delete_blob_files(blob))
+    return True
+
+
+def import_image(product_id, source):
+    """Download or read one image, convert it and attach it to the product."""
+    from .models import ProductImage
+
+    close_old_connections()
+    path = None
+    try:
+        if is_url(source):
+            name = os.path.basename(urlparse(source).path) or f"{product_id}.jpg"
+            path = _download(source)
+        else:
+            name = os.path.basename(source)
+
+        source = path or source
+        image = ProductImage(product_id=product_id)
+        return store_image(image, content_hash(source), name, source)
+    finally:
+        discard(path)
+        close_old_connections()
+
+
+def _check_public(url):
+    """Refuse URLs whose host resolves to a private, loopback or link-local address."""
+    host = urlparse(url).hostname
+    if not is_url(url) or not host:
+        raise ImageDownloadError(f"Not an http(s) URL: {url}")
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror as e:
+        raise ImageDownloadError(f"Cannot resolve {host}: {e}")
+    for info in infos:
+        # IPv6 link-local addresses may carry a %scope suffix
+        if not ipaddress.ip_address(info[4][0].split("%")[0]).is_global:
+            raise ImageDownloadError(f"{host} resolves to a non-public address.")
+
+
+def _download(url):
+    """Stream ``url`` into a temp file and return its path.
+
+    Every redirect hop is checked with _check_public, and the body is cut
+    off at PRODUCT_IMAGE_MAX_DOWNLOAD_SIZE.
+    """
+    max_size = settings.PRODUCT_IMAGE_MAX_DOWNLOAD_SIZE
+    for _ in range(MAX_REDIRECTS + 1):
+        _check_public(url)
+        response = requests.get(url, timeout=30, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        response.close()
+        url = urljoin(url, response.headers["location"])
+    else:
+        raise ImageDownloadError(f"More than {MAX_REDIRECTS} redirects.")
+
+    with response:
+        response.raise_for_status()
+        if int(response.headers.get("content-length") or 0) > max_size:
+            raise ImageDownloadError(f"Larger than {max_size} bytes.")
+        with tempfile.NamedTemporaryFile(
+            dir=settings.FILE_UPLOAD_TEMP_DIR, prefix=SPOOL_PREFIX, delete=False
+        ) as fh:
+            try:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    if fh.tell() + len(chunk) > max_size:
+                        raise ImageDownloadError(f"Larger than {max_size} bytes.")
+                    fh.write(chunk)
+            except Exception:
+                discard(fh.name)
+                raise
+    return fh.name
+
+
+def queue_image_imports(jobs):
+    """Hand (product_id, url_or_path) pairs to background workers; returns futures."""
+    return [_thread_pool().submit(import_image, pid, source) for pid, source in jobs]
+
+
+def attach_converted_image(image_id, name, source, sha256):
+    """Convert an uploaded image and store it on its PROCESSING ProductImage row.
+
+    ``source`` is what spool_upload returned; a temp file is removed here.
+    """
+    from .models import ProductImage
+
+    try:
+        image = ProductImage.objects.get(pk=image_id)
+        try:
+            return store_image(image, sha256, name, source)
+        except Exception:
+            image.status = ProductImage.FAILED
+            image.save(update_fields=["status"])
+            raise
+    finally:
+        discard(source)
+
+
+def backfill_variants(image_id):
+    """Generate the VARIANTS renditions for an existing ProductImage.
+
+    Returns the ids of the products to invalidate (none if the image is gone
+    or has no file).
+    """
+    from .models import ProductImage
+
+    image = ProductImage.objects.filter(pk=image_id).exclude(image="").first()
+    if image is None:
+        return []
+    with image.image.open("rb") as fh:
+        data = fh.read()
+    variants = save_variants(image, run_in_pool(encode_variants, data, **encode_limits()))
+    ProductImage.objects.filter(pk=image_id).update(variants=variants)
+    return [image.product_id]
+
+
+def backfill_placeholder(image_id):
+    """Compute the placeholder for an existing ProductImage (and its blob).
+
+    Returns the ids of the products to invalidate (none if the image is gone
+    or has no file).
+    """
+    from .models import ImageBlob, ProductImage
+
+    image = ProductImage.objects.filter(pk=image_id).exclude(image="").first()
+    if image is None:
+        return []
+    # The smallest stored rendition is plenty for a 16px preview
+    name = image.image.name
+    if image.variants:
+        name = min(image.variants.values(), key=lambda v: v["width"])["name"]
+    with image.image.storage.open(name, "rb") as fh:
+        data = fh.read()
+    placeholder = run_in_pool(encode_placeholder, data, **encode_limits())
+
+    if image.blob_id is None:
+        ProductImage.objects.filter(pk=image_id).update(placeholder=placeholder)
+        return [image.product_id]
+    ImageBlob.objects.filter(pk=image.blob_id).update(placeholder=placeholder)
+    shared = ProductImage.objects.filter(blob_id=image.blob_id)
+    shared.update(placeholder=placeholder)
+    return list(shared.values_list("product_id", flat=True).distinct())
+
+
+def reencode_image(image_id):
+    """Re-encode a stored image and its variants with the current settings.
+
+    The file an image shares through its blob is re-encoded once and every
+    ProductImage on that blob is updated. New files are written under new
+    names and the old ones deleted after commit, so no row ever points at a
+    missing file. Returns ``(product_ids, bytes_before, bytes_after)``.
+    """
+    from .models import ImageBlob, ProductImage
+
+    image = ProductImage.objects.filter(pk=image_id).exclude(image="").first()
+    if image is None:
+        return [], 0, 0
+    owner = ImageBlob.objects.get(pk=image.blob_id) if image.blob_id else image
+    storage = owner.image.storage
+    old_names = [owner.image.name, *(v["name"] for v in owner.variants.values())]
+    bytes_before = sum(storage.size(name) for name in old_names if storage.exists(name))
+
+    # Originals aren't kept, so the stored image is the source
+    with owner.image.open("rb") as fh:
+        data = fh.read()
+    webp, renditions, placeholder = run_in_pool(encode_webp, data, True, **encode_limits())
+    owner.image.name = storage.save(owner.image.name, ContentFile(webp))
+    fields = {
+        "image": owner.image.name,
+        "variants": save_variants(owner, renditions),
+        "placeholder": placeholder,
+    }
+    new_names = [fields["image"], *(v["name"] for v in fields["variants"].values())]
+    bytes_after = len(webp) + sum(len(data) for data, _, _ in renditions.values())
+
+    with transaction.atomic():
+        if image.blob_id:
+            # Locked first, as attach_blob does, so no upload copies the old names
+            found = ImageBlob.objects.select_for_update().filter(pk=image.blob_id).exists()
+            images = ProductImage.objects.filter(blob_id=image.blob_id)
+        else:
+            found = True
+            images = ProductImage.objects.filter(pk=image_id).exclude(image="")
+        updated = found and images.update(**fields)
+        if updated and image.blob_id:
+            ImageBlob.objects.filter(pk=image.blob_id).update(**fields)
+        product_ids = list(images.values_list("product_id", flat=True).distinct())
+
+    if not updated:
+        # Deleted while we were encoding
+        for name in set(new_names) - set(old_names):
+            storage.delete(name)
+        return [], 0, 0
+    # Backends that overwrite in place may hand back a name we already had
+    stale = set(old_names) - set(new_names)
+    transaction.on_commit(lambda: [storage.delete(name) for name in stale])
+    return product_ids, bytes_before, bytes_after
+
+
+def create_product_images(product, uploads):
+    """Create the ProductImage rows for uploaded files; returns the jobs still to run.
+
+    Uploads whose bytes are already stored point at the existing blob and are
+    READY at once: no encode, no storage write. The rest start out PROCESSING
+    and come back as queue_image_conversions jobs. Call inside a transaction.
+    """
+    from .models import ImageBlob, Product, ProductImage
+
+    hashes = [content_hash(upload) for upload in uploads]
+    # Locked until commit so release_blob can't delete them under us
+    blobs = {
+        blob.sha256: blob
+        for blob in ImageBlob.objects.select_for_update().filter(sha256__in=hashes)
+    }
+    images = ProductImage.objects.bulk_create(
+        ProductImage(
+            product=product,
+            blob=blobs[sha256],
+            image=blobs[sha256].image.name,
+            variants=blobs[sha256].variants,
+            placeholder=blobs[sha256].placeholder,
+        )
+        if sha256 in blobs
+        else ProductImage(product=product, image="", status=ProductImage.PROCESSING)
+        for sha256 in hashes
+    )
+    if any(image.blob_id for image in images):
+        # bulk_create skips the cover image signal
+        Product.refresh_cover_images([product.pk])
+    return [
+        (image.pk, upload.name, spool_upload(upload), sha256)
+        for image, upload, sha256 in zip(images, uploads, hashes)
+        if image.blob_id is None
+    ]
+
+
+def _attach_in_background(*job):
+    close_old_connections()
+    try:
+        return attach_converted_image(*job)
+    finally:
+        # Pool threads outlive the job; don't keep a persistent connection
+        # open in each of them
+        connection.close()
+
+
+def queue_image_conversions(jobs):
+    """Convert uploaded images off the request thread; returns futures.
+
+    ``jobs`` are (ProductImage pk, upload name, spool_upload result, sha256).
+    Each job waits on the process pool from a thread, which then writes the
+    WebP to storage so uploads to S3 overlap too. With PRODUCT_IMAGE_WORKERS = 0 the
+    jobs run inline and an empty list is returned.
+    """
+    if not settings.PRODUCT_IMAGE_WORKERS:
+        for job in jobs:
+            attach_converted_image(*job)
+        return []
+    return [_thread_pool().submit(_attach_in_background, *job) for job in jobs]
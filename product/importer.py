@@ -0,0 +1,161 @@
+"""Streaming bulk import of catalog files (CSV or JSON Lines).
+
+CSV columns: name, description, price, category, subcategory, bestseller,
+show, stock_S, stock_M, stock_L, stock_XL and images (``|`` separated).
+JSONL lines use the API shape: ``stock_details`` as a list of
+``{"size", "quantity"}`` and ``images`` as a list of URLs or paths.
+"""
+
+import csv
+import io
+import json
+import re
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_catalog_version
+from .images import queue_image_imports
+from .models import Product, ProductStock
+from .serializers import ProductImportSerializer
+
+FORMATS = ("csv", "jsonl")
+STOCK_COLUMN_PREFIX = "stock_"
+
+
+# Lone surrogates: what undecodable bytes become under errors="surrogateescape"
+UNDECODABLE = re.compile("[\udc80-\udcff]")
+NOT_UTF8 = {"non_field_errors": ["Not valid UTF-8."]}
+
+
+def _csv_rows(stream):
+    reader = csv.DictReader(stream)
+    line = 1
+    while True:
+        line += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # The reader carries on from the next line
+            yield line, None, {"non_field_errors": [f"Invalid CSV: {e}."]}
+            continue
+        if any(UNDECODABLE.search(str(value)) for value in (*row, *row.values())):
+            yield line, None, NOT_UTF8
+            continue
+        stock_details = [
+            {"size": column[len(STOCK_COLUMN_PREFIX):], "quantity": value}
+            for column, value in row.items()
+            if column and column.startswith(STOCK_COLUMN_PREFIX) and value not in ("", None)
+        ]
+        images = [src.strip() for src in (row.get("images") or "").split("|") if src.strip()]
+        data = {
+            key: value
+            for key, value in row.items()
+            if key and not key.startswith(STOCK_COLUMN_PREFIX) and key != "images"
+            and value not in ("", None)
+        }
+        yield line, {**data, "stock_details": stock_details, "images": images}, None
+
+
+def _jsonl_rows(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        if UNDECODABLE.search(text):
+            yield line, None, NOT_UTF8
+            continue
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            yield line, None, {"non_field_errors": [f"Invalid JSON: {e.msg}."]}
+            continue
+        if not isinstance(data, dict):
+            yield line, None, {"non_field_errors": ["Expected a JSON object."]}
+            continue
+        yield line, data, None
+
+
+def open_text(binary):
+    """Decode a binary stream for iter_rows.
+
+    Bytes that aren't UTF-8 are kept as lone surrogates, so the row holding
+    them is reported instead of the whole import failing part way through.
+    """
+    return io.TextIOWrapper(
+        binary, encoding="utf-8-sig", errors="surrogateescape", newline=""
+    )
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row data, parse error) from a text stream (see open_text)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    return _csv_rows(stream) if fmt == "csv" else _jsonl_rows(stream)
+
+
+def import_catalog(stream, fmt, chunk_size=1000, allow_paths=False):
+    """Import products chunk by chunk, collecting per-row errors.
+
+    Each chunk is validated, then written with one bulk INSERT for products
+    and one for stock inside a transaction. Invalid rows are reported and
+    skipped without aborting the rest. Image sources are handed to background
+    workers for download and WebP conversion. Local paths are only accepted
+    when ``allow_paths`` is set (management command, not the HTTP endpoint).
+
+    Returns the report and the futures of the queued image jobs.
+    """
+    report = {"created": 0, "errors": [], "images_queued": 0}
+    image_futures = []
+    rows = iter_rows(stream, fmt)
+    # One serializer validates every row, so DRF builds its fields only once
+    serializer = ProductImportSerializer(context={"allow_paths": allow_paths})
+
+    while chunk := list(islice(rows, chunk_size)):
+        valid = []
+        for line, data, error in chunk:
+            if error is None:
+                try:
+                    valid.append(serializer.run_validation(data))
+                    continue
+                except ValidationError as e:
+                    error = e.detail
+            report["errors"].append({"row": line, "errors": error})
+
+        if not valid:
+            continue
+
+        with transaction.atomic():
+            products = Product.objects.bulk_create(
+                Product(
+                    **{
+                        k: v
+                        for k, v in row.items()
+                        if k not in ("stock_details", "images")
+                    },
+                    # bulk_create skips the stock signals; set totals up front
+                    total_stock=sum(s["quantity"] for s in row.get("stock_details", [])),
+                    in_stock=any(s["quantity"] for s in row.get("stock_details", [])),
+                )
+                for row in valid
+            )
+            ProductStock.objects.bulk_create(
+                ProductStock(product=product, **stock)
+                for product, row in zip(products, valid)
+                for stock in row.get("stock_details", [])
+            )
+        # bulk_create skips model signals, so invalidate explicitly
+        bump_catalog_version()
+
+        report["created"] += len(products)
+        jobs = [
+            (product.pk, source)
+            for product, row in zip(products, valid)
+            for source in row.get("images", [])
+        ]
+        report["images_queued"] += len(jobs)
+        image_futures += queue_image_imports(jobs)
+
+    return report, image_futures
@@ -0,0 +1,18 @@
+from product.backfill import ImageBackfillCommand
+from product.images import backfill_placeholder
+from product.models import ProductImage
+
+
+class Command(ImageBackfillCommand):
+    help = (
+        "Compute inline placeholders for product images that have none. "
+        "Safe to interrupt: finished images are skipped on the next run."
+    )
+
+    def pending(self):
+        return ProductImage.objects.filter(
+            status=ProductImage.READY, placeholder=""
+        ).exclude(image="")
+
+    def process(self, pk):
+        return backfill_placeholder(pk)
@@ -0,0 +1,18 @@
+from product.backfill import ImageBackfillCommand
+from product.images import backfill_variants
+from product.models import ProductImage
+
+
+class Command(ImageBackfillCommand):
+    help = (
+        "Generate responsive variants for product images that have none. "
+        "Safe to interrupt: finished images are skipped on the next run."
+    )
+
+    def pending(self):
+        return ProductImage.objects.filter(status=ProductImage.READY, variants={}).exclude(
+            image=""
+        )
+
+    def process(self, pk):
+        return backfill_variants(pk)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from product.cache import bump_catalog_version
+from product.models import Product, ProductStock
+
+
+class Command(BaseCommand):
+    help = "Compare Product.total_stock/in_stock with ProductStock and optionally fix drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repair", action="store_true", help="Rewrite drifted rows.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        stock = ProductStock.objects.filter(product=OuterRef("pk"))
+        totals = stock.order_by().values("product").annotate(total=Sum("quantity"))
+        products = Product.objects.annotate(
+            actual_total=Coalesce(Subquery(totals.values("total")), 0),
+            actual_in_stock=Exists(stock.filter(quantity__gt=0)),
+        ).order_by("pk")
+
+        checked = drifted = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                products.filter(pk__gt=last_pk).values_list(
+                    "pk", "total_stock", "in_stock", "actual_total", "actual_in_stock"
+                )[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            checked += len(batch)
+
+            drift = [row for row in batch if row[1:3] != row[3:5]]
+            for pk, total, in_stock, actual_total, actual_in_stock in drift:
+                self.stdout.write(
+                    f"Product {pk}: total_stock {total} -> {actual_total}, "
+                    f"in_stock {in_stock} -> {actual_in_stock}"
+                )
+            drifted += len(drift)
+            if drift and options["repair"]:
+                with transaction.atomic():
+                    Product.refresh_stock_totals([row[0] for row in drift])
+
+        if drifted and options["repair"]:
+            bump_catalog_version()
+        action = "repaired" if options["repair"] else "found"
+        self.stdout.write(f"Checked {checked} products, {action} {drifted} with drift.")
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from product.feeds import FEED_FORMATS, stream_feed
+
+
+class Command(BaseCommand):
+    help = "Stream the visible catalog as an NDJSON, CSV or Google Merchant XML feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("format", choices=FEED_FORMATS)
+        parser.add_argument("--output", help="File to write; defaults to stdout.")
+        parser.add_argument("--chunk-size", type=int, default=settings.CATALOG_FEED_CHUNK_SIZE)
+        parser.add_argument(
+            "--base-url",
+            default="",
+            help="Prefix for relative image URLs, e.g. https://api.example.com",
+        )
+
+    def handle(self, *args, **options):
+        pieces = stream_feed(
+            options["format"],
+            chunk_size=options["chunk_size"],
+            base_url=options["base_url"],
+        )
+        if not options["output"]:
+            for piece in pieces:
+                self.stdout.write(piece, ending="")
+            return
+
+        with open(options["output"], "w", encoding="utf-8", newline="") as feed:
+            for piece in pieces:
+                feed.write(piece)
+        self.stdout.write(f"Wrote {options['output']}.")
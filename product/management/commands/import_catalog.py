@@ -0,0 +1,41 @@
+import json
+import os
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importer import FORMATS, import_catalog, open_text
+
+
+class Command(BaseCommand):
+    help = "Bulk import products from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=FORMATS)
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Cannot tell the format of {path}; pass --format.")
+
+        with open(path, "rb") as fh:
+            report, image_futures = import_catalog(
+                open_text(fh), fmt, chunk_size=options["chunk_size"], allow_paths=True
+            )
+
+        for error in report["errors"]:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            f"Created {report['created']} products, {len(report['errors'])} rows failed."
+        )
+
+        if image_futures:
+            self.stdout.write(f"Converting {len(image_futures)} images...")
+            wait(image_futures)
+            failed = [f for f in image_futures if f.exception()]
+            for future in failed:
+                self.stderr.write(f"Image failed: {future.exception()}")
+            self.stdout.write(f"Converted {len(image_futures) - len(failed)} images.")
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from product.images import SPOOL_PREFIX
+from product.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the image rows of conversions lost to a worker restart, and "
+        "their leftover temp files. Conversions only live in the memory of the "
+        "process that queued them, so there is nothing left to retry; run this "
+        "after deploys or on a schedule."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=30,
+            help="Minutes after which a conversion still processing counts as lost.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["older_than"])
+        # Model deletes, so the signals invalidate the caches per product
+        _, deleted = ProductImage.objects.filter(
+            status=ProductImage.PROCESSING, created_at__lt=cutoff
+        ).delete()
+        lost = deleted.get(ProductImage._meta.label, 0)
+
+        removed = 0
+        spool_dir = settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+        oldest = time.time() - options["older_than"] * 60
+        for entry in os.scandir(spool_dir):
+            if entry.name.startswith(SPOOL_PREFIX) and entry.stat().st_mtime < oldest:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+
+        self.stdout.write(
+            f"Deleted {lost} lost conversions, removed {removed} temp files."
+        )
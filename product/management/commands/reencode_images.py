@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+
+from django.db.models import Min, Q
+
+from product.backfill import ImageBackfillCommand, Throttle
+from product.images import VARIANTS, reencode_image
+from product.models import ProductImage
+
+
+class Command(ImageBackfillCommand):
+    help = (
+        "Re-encode every stored product image and its variants with the current "
+        "WebP settings. Progress is checkpointed after each batch, so a killed "
+        "run picks up where it stopped; a finished run removes the checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--checkpoint",
+            default="reencode_images.checkpoint",
+            help="File holding the last finished pk.",
+        )
+        parser.add_argument(
+            "--restart", action="store_true", help="Ignore the checkpoint and start over."
+        )
+        parser.add_argument(
+            "--writes-per-second",
+            type=float,
+            default=20,
+            help="Storage writes allowed per second across all threads (0 for no limit).",
+        )
+
+    def pending(self):
+        # Images sharing a blob share its files: only the first one is walked
+        first_per_blob = (
+            ProductImage.objects.filter(blob__isnull=False)
+            .values("blob")
+            .annotate(first=Min("pk"))
+            .values("first")
+        )
+        return (
+            ProductImage.objects.filter(status=ProductImage.READY)
+            .exclude(image="")
+            .filter(Q(blob__isnull=True) | Q(pk__in=first_per_blob))
+        )
+
+    def process(self, pk):
+        # One image and one file per variant
+        self.throttle.wait(1 + len(VARIANTS))
+        product_ids, before, after = reencode_image(pk)
+        with self.lock:
+            self.bytes_before += before
+            self.bytes_after += after
+        return product_ids
+
+    def resume_after(self, options):
+        if options["restart"]:
+            return 0
+        try:
+            with open(options["checkpoint"]) as fh:
+                last_pk = json.load(fh)["last_pk"]
+        except FileNotFoundError:
+            return 0
+        self.stdout.write(f"Resuming after image {last_pk}.")
+        return last_pk
+
+    def batch_done(self, last_pk, options):
+        # Written aside and renamed, so a kill never leaves half a checkpoint
+        path = options["checkpoint"]
+        with open(f"{path}.tmp", "w") as fh:
+            json.dump({"last_pk": last_pk}, fh)
+        os.replace(f"{path}.tmp", path)
+
+    def handle(self, *args, **options):
+        self.throttle = Throttle(options["writes_per_second"])
+        self.lock = threading.Lock()
+        self.bytes_before = self.bytes_after = 0
+        super().handle(*args, **options)
+
+        try:
+            os.remove(options["checkpoint"])
+        except FileNotFoundError:
+            pass
+        saved = self.bytes_before - self.bytes_after
+        percent = 100 * saved / self.bytes_before if self.bytes_before else 0
+        self.stdout.write(
+            f"{self.bytes_before} bytes -> {self.bytes_after} bytes, "
+            f"saved {saved} bytes ({percent:.1f}%)."
+        )
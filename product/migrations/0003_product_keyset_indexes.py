@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_productstock_product_pro_product_0c0c8a_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('show', True)), fields=['id'], name='product_show_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('show', True)), fields=['-bestseller', 'id'], name='product_show_bestseller_idx'),
+        ),
+    ]
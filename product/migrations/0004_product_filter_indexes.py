@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('show', True)), fields=['category', 'subcategory', 'price'], name='product_show_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('show', True)), fields=['subcategory', 'price'], name='product_show_subcategory_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('show', True)), fields=['price'], name='product_show_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productstock',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['size', 'product'], name='productstock_in_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:57
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_stock_totals(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    ProductStock = apps.get_model("product", "ProductStock")
+    stock = ProductStock.objects.filter(product=OuterRef("pk"))
+    totals = stock.order_by().values("product").annotate(total=Sum("quantity"))
+    Product.objects.update(
+        total_stock=Coalesce(Subquery(totals.values("total")), 0),
+        in_stock=Exists(stock.filter(quantity__gt=0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_stock_totals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True), ('show', True)), fields=['id'], name='product_in_stock_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True), ('show', True)), fields=['-bestseller', 'id'], name='product_in_stock_best_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='placeholder',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='placeholder',
+            field=models.TextField(blank=True),
+        ),
+    ]
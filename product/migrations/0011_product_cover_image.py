@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_cover_images(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    ProductImage = apps.get_model("product", "ProductImage")
+    first = (
+        ProductImage.objects.filter(product=OuterRef("pk"), status="ready")
+        .exclude(image="")
+        .order_by("id")
+    )
+    Product.objects.update(cover_image=Subquery(first.values("id")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_image_placeholders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cover_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='product.productimage'),
+        ),
+        migrations.RunPython(backfill_cover_images, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,15 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class ProductManager(models.Manager):
+    def get_queryset(self):
+        # search_vector is only used inside SQL; don't ship it to Python
+        return super().get_queryset().defer("search_vector")
 
 
 class Product(models.Model):
@@ -21,16 +32,157 @@ class Product(models.Model):
     subcategory = models.CharField(max_length=20, choices=SUBCATEGORY_CHOICES)
     show = models.BooleanField(default=True)
     bestseller = models.BooleanField(default=False)
+    # Maintained by Postgres from name (weight A) and description (weight B)
+    search_vector = models.GeneratedField(
+        expression=SearchVector("name", weight="A", config="english")
+        + SearchVector("description", weight="B", config="english"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    # Denormalized from ProductStock; kept in step by refresh_stock_totals()
+    total_stock = models.PositiveIntegerField(default=0, editable=False)
+    in_stock = models.BooleanField(default=False, editable=False)
+    # First READY image, for listings that show one picture per product;
+    # kept in step by refresh_cover_images()
+    cover_image = models.ForeignKey(
+        "ProductImage",
+        related_name="+",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    objects = ProductManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="product_search_vector_idx"),
+            # Keyset pagination orderings over the visible catalog
+            models.Index(
+                fields=["id"],
+                condition=models.Q(show=True),
+                name="product_show_id_idx",
+            ),
+            models.Index(
+                fields=["-bestseller", "id"],
+                condition=models.Q(show=True),
+                name="product_show_bestseller_idx",
+            ),
+            # Catalog filters (product.filters)
+            models.Index(
+                fields=["category", "subcategory", "price"],
+                condition=models.Q(show=True),
+                name="product_show_category_idx",
+            ),
+            models.Index(
+                fields=["subcategory", "price"],
+                condition=models.Q(show=True),
+                name="product_show_subcategory_idx",
+            ),
+            models.Index(
+                fields=["price"],
+                condition=models.Q(show=True),
+                name="product_show_price_idx",
+            ),
+            # In-stock-only listings (?in_stock=true) in both orderings
+            models.Index(
+                fields=["id"],
+                condition=models.Q(show=True, in_stock=True),
+                name="product_in_stock_id_idx",
+            ),
+            models.Index(
+                fields=["-bestseller", "id"],
+                condition=models.Q(show=True, in_stock=True),
+                name="product_in_stock_best_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def refresh_stock_totals(cls, product_ids):
+        """Recompute total_stock and in_stock from ProductStock in one UPDATE.
+
+        Runs in the caller's transaction, so the totals commit (or roll back)
+        together with the stock change that prompted them.
+        """
+        stock = ProductStock.objects.filter(product=OuterRef("pk"))
+        totals = stock.order_by().values("product").annotate(total=Sum("quantity"))
+        return cls.objects.filter(pk__in=product_ids).update(
+            total_stock=Coalesce(Subquery(totals.values("total")), 0),
+            in_stock=Exists(stock.filter(quantity__gt=0)),
+        )
+
+    @classmethod
+    def refresh_cover_images(cls, product_ids):
+        """Point cover_image at each product's lowest-id READY image in one UPDATE."""
+        first = (
+            ProductImage.objects.filter(product=OuterRef("pk"), status=ProductImage.READY)
+            .exclude(image="")
+            .order_by("id")
+        )
+        return cls.objects.filter(pk__in=product_ids).update(
+            cover_image=Subquery(first.values("id")[:1])
+        )
+
+
+class ImageBlob(models.Model):
+    """A converted image stored once and shared by every upload of the same bytes."""
+
+    sha256 = models.CharField(max_length=64, unique=True)  # of the uploaded bytes
+    image = models.ImageField(upload_to="product_images/")
+    variants = models.JSONField(default=dict, blank=True)
+    placeholder = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 
 class ProductImage(models.Model):
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PROCESSING, "Processing"),
+        (READY, "Ready"),
+        (FAILED, "Failed"),
+    ]
+
     product = models.ForeignKey(
         Product, related_name="images", on_delete=models.CASCADE
     )
     image = models.ImageField(upload_to="product_images/")
+    # Uploads are converted in the background (product.images); image is
+    # empty until the row is READY
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=READY)
+    # Width-bounded renditions (product.images.VARIANTS):
+    # {name: {"name": storage name, "width": px, "height": px}}
+    variants = models.JSONField(default=dict, blank=True)
+    # Tiny blurred preview as a data: URI, shown until the image loads
+    placeholder = models.TextField(blank=True)
+    # image, variants and placeholder are copied from the blob; PROTECT keeps a shared
+    # blob (and its files) alive while any ProductImage still points at it
+    blob = models.ForeignKey(
+        ImageBlob,
+        related_name="images",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    # Lets recover_image_conversions tell a lost conversion from a slow one
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status="processing"),
+                name="productimage_processing_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Image for {self.product.name}"
@@ -54,21 +206,23 @@ class ProductStock(models.Model):
         unique_together = ("product", "size")  # Prevent duplicate entries
         indexes = [
             models.Index(fields=["product", "size"]),
+            # "In stock in size X" filter (product.filters)
+            models.Index(
+                fields=["size", "product"],
+                condition=models.Q(quantity__gt=0),
+                name="productstock_in_stock_idx",
+            ),
         ]
 
     def __str__(self):
         return f"{self.product.name} - {self.size}: {self.quantity}"
 
     def delete(self, *args, **kwargs):
-        # Remove product from all carts
+        # A size that is no longer sold can't stay in carts
         from cart.models import CartItem
 
         # CartItem.product_id points to Product, not ProductStock
-        CartItem.objects.filter(product_id=self.product).delete()
-
-        # Remove product from all orders
-        from orderItem.models import OrderItem
-
-        OrderItem.objects.filter(product=self.product).delete()
+        CartItem.objects.filter(product_id=self.product_id, size=self.size).delete()
 
+        # Orders already placed for this size are history: keep them
         super().delete(*args, **kwargs)
@@ -0,0 +1,102 @@
+"""Keyset (cursor) pagination for product listings.
+
+Pages are selected with a WHERE on the ordering key of the last row seen and a
+LIMIT, never with OFFSET, so deep pages cost the same as the first one.
+"""
+
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+# ?ordering= value -> ordering fields; every ordering ends on a unique key
+ORDERINGS = {
+    "id": ("id",),
+    "bestseller": ("-bestseller", "id"),
+}
+# Python type of each ordering field's cursor value
+FIELD_TYPES = {"id": int, "bestseller": bool}
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor, fields):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    for field, value in zip(fields, values):
+        # type(), not isinstance(): bool is a subclass of int
+        if type(value) is not FIELD_TYPES[field.lstrip("-")]:
+            raise ValidationError({"cursor": "Invalid cursor."})
+    return values
+
+
+def keyset_filter(fields, values):
+    """Build the "row comes after (values)" condition for the given ordering."""
+    condition = Q()
+    for i, field in enumerate(fields):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        step = Q(**{f"{name}__{lookup}": values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev_field.lstrip("-"): prev_value})
+        condition |= step
+    return condition
+
+
+class KeysetPagination:
+    """Opt-in: only applies when the request carries ?cursor= or ?page_size=."""
+
+    def __init__(self, request):
+        params = request.query_params
+        self.request = request
+        self.enabled = "cursor" in params or "page_size" in params
+
+        ordering = params.get("ordering", "id")
+        if ordering not in ORDERINGS:
+            raise ValidationError({"ordering": f"Must be one of: {', '.join(ORDERINGS)}."})
+        self.ordering = ordering
+        self.fields = ORDERINGS[ordering]
+
+        try:
+            page_size = int(params.get("page_size", settings.PRODUCT_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({"page_size": "Must be an integer."})
+        self.page_size = max(1, min(page_size, settings.PRODUCT_MAX_PAGE_SIZE))
+
+        cursor = params.get("cursor")
+        self.after = decode_cursor(cursor, self.fields) if cursor else None
+
+    def paginate_queryset(self, queryset):
+        """Return the page as a list; expects a values() queryset."""
+        queryset = queryset.order_by(*self.fields)
+        if self.after is not None:
+            queryset = queryset.filter(keyset_filter(self.fields, self.after))
+
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        params = self.request.query_params.copy()
+        params["cursor"] = encode_cursor(
+            [last[field.lstrip("-")] for field in self.fields]
+        )
+        params["page_size"] = str(self.page_size)
+        return self.request.build_absolute_uri(f"{self.request.path}?{params.urlencode()}")
+
+    def get_paginated_data(self, data):
+        return {"next": self.get_next_link(), "results": data}
@@ -0,0 +1,15 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class IsManagerOrFeedToken(BasePermission):
+    """Managers, or marketplace crawlers passing ?token=CATALOG_FEED_TOKEN."""
+
+    def has_permission(self, request, view):
+        if request.user.is_authenticated and request.user.role == 'manager':
+            return True
+        token = request.query_params.get("token", "")
+        secret = settings.CATALOG_FEED_TOKEN
+        return bool(secret) and hmac.compare_digest(token.encode(), secret.encode())
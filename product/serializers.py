@@ -1,4 +1,8 @@
+from collections import defaultdict
+
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from .images import is_url, variant_urls
 from .models import Product, ProductStock, ProductImage
 
 class ProductStockSerializer(serializers.ModelSerializer):
@@ -7,24 +11,61 @@ class ProductStockSerializer(serializers.ModelSerializer):
         fields = ['id', 'size', 'quantity']
 
 
+def validate_unique_sizes(stock_details):
+    sizes = [stock['size'] for stock in stock_details]
+    if len(sizes) != len(set(sizes)):
+        raise ValidationError("Each size may only appear once.")
+    return stock_details
+
+
+class ProductImageListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # A failed conversion has no file to show. Filtered here rather than
+        # in the query so prefetched images are reused
+        images = data.all() if hasattr(data, 'all') else data
+        return super().to_representation(
+            [image for image in images if image.status != ProductImage.FAILED]
+        )
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'status', 'variants', 'srcset', 'placeholder']
+        list_serializer_class = ProductImageListSerializer
+
+    def get_variants(self, obj):
+        return variant_urls(obj.variants, obj.image.storage)[0]
+
+    def get_srcset(self, obj):
+        return variant_urls(obj.variants, obj.image.storage)[1]
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    RELATIONS = ('stock_details', 'images')
+
     stock_details = ProductStockSerializer(many=True,required = False)
     images = ProductImageSerializer(many=True, required=False)
+    cover_image = ProductImageSerializer(read_only=True)
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'category', 'subcategory',
-            'bestseller', 'show',
+            'bestseller', 'show', 'cover_image',
             'stock_details', 'images'
         ]
 
+    def __init__(self, *args, fields=None, **kwargs):
+        # fields: names to emit (see sparse_fields); None emits everything
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     def create(self, validated_data):
         stock_data = validated_data.pop('stock_details',[])
         image_data = validated_data.pop('images', [])
@@ -39,3 +80,145 @@ class ProductSerializer(serializers.ModelSerializer):
             ProductImage.objects.create(product=product, **image)
 
         return product
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    """Validates one row of a bulk catalog import (see product.importer)."""
+
+    stock_details = ProductStockSerializer(many=True, required=False)
+    images = serializers.ListField(child=serializers.CharField(), required=False)
+
+    class Meta:
+        model = Product
+        fields = [
+            'name', 'description', 'price', 'category', 'subcategory',
+            'bestseller', 'show', 'stock_details', 'images'
+        ]
+
+    def validate_stock_details(self, value):
+        return validate_unique_sizes(value)
+
+    def validate_images(self, value):
+        if not self.context.get('allow_paths') and not all(is_url(src) for src in value):
+            raise ValidationError("Images must be http(s) URLs.")
+        return value
+
+
+def sparse_fields(params):
+    """Resolve ?fields= and ?expand= into the ProductSerializer fields to emit.
+
+    ``fields`` picks top-level fields, ``expand`` picks the nested relations
+    (``stock_details``, ``images``) to include. Returns None when neither is
+    given, meaning the full representation. ``id`` is always included.
+    """
+    if "fields" not in params and "expand" not in params:
+        return None
+
+    allowed = ProductSerializer.Meta.fields
+    requested = {}
+    for param in ("fields", "expand"):
+        names = [n.strip() for n in params.get(param, "").split(",") if n.strip()]
+        choices = ProductSerializer.RELATIONS if param == "expand" else allowed
+        unknown = [n for n in names if n not in choices]
+        if unknown:
+            raise ValidationError({param: f"Unknown fields: {', '.join(unknown)}."})
+        requested[param] = names
+
+    if "fields" in params:
+        selected = set(requested["fields"]) | set(requested["expand"])
+    else:
+        selected = (set(allowed) - set(ProductSerializer.RELATIONS)) | set(requested["expand"])
+    selected.add("id")
+    return [name for name in allowed if name in selected]
+
+
+def _image_data(storage, pk, name, status, variants, placeholder):
+    # Same shape as ProductImageSerializer
+    urls, srcset = variant_urls(variants, storage)
+    return {
+        "id": pk,
+        "image": storage.url(name) if name else None,
+        "status": status,
+        "variants": urls,
+        "srcset": srcset,
+        "placeholder": placeholder,
+    }
+
+
+class ProductReadSerializer:
+    """Read-only twin of ProductSerializer for the catalog hot path.
+
+    Builds plain dicts from ``values()`` rows and ``values_list()`` tuples
+    instead of running DRF field machinery per object. Output must stay
+    byte-identical to ProductSerializer once rendered; extend both together.
+    """
+
+    # cover_image is read through a LEFT JOIN in the same values() query
+    COVER_COLUMNS = [
+        "cover_image__id", "cover_image__image", "cover_image__status",
+        "cover_image__variants", "cover_image__placeholder",
+    ]
+
+    def __init__(self, instance, many=False, fields=None):
+        # instance: a row from values(*columns(fields)), or an iterable of them
+        self.instance = instance
+        self.many = many
+        self.fields = list(fields) if fields is not None else list(ProductSerializer.Meta.fields)
+
+    @classmethod
+    def columns(cls, fields=None):
+        """Product columns to pass to values() for the given sparse fieldset."""
+        fields = fields if fields is not None else ProductSerializer.Meta.fields
+        columns = []
+        for field in fields:
+            if field == "cover_image":
+                columns += cls.COVER_COLUMNS
+            elif field not in ProductSerializer.RELATIONS:
+                columns.append(field)
+        return columns
+
+    @property
+    def data(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        ids = [row["id"] for row in rows]
+
+        stock = defaultdict(list)
+        if "stock_details" in self.fields and ids:
+            for product_id, pk, size, quantity in (
+                ProductStock.objects.filter(product_id__in=ids)
+                .order_by("id")
+                .values_list("product_id", "id", "size", "quantity")
+            ):
+                stock[product_id].append({"id": pk, "size": size, "quantity": quantity})
+
+        storage = ProductImage._meta.get_field("image").storage
+        images = defaultdict(list)
+        if "images" in self.fields and ids:
+            for product_id, *image in (
+                ProductImage.objects.filter(product_id__in=ids)
+                .exclude(status=ProductImage.FAILED)
+                .order_by("id")
+                .values_list(
+                    "product_id", "id", "image", "status", "variants", "placeholder"
+                )
+            ):
+                images[product_id].append(_image_data(storage, *image))
+
+        data = []
+        for row in rows:
+            item = {}
+            for field in self.fields:
+                if field == "stock_details":
+                    item[field] = stock[row["id"]]
+                elif field == "images":
+                    item[field] = images[row["id"]]
+                elif field == "cover_image":
+                    cover = [row[column] for column in self.COVER_COLUMNS]
+                    item[field] = _image_data(storage, *cover) if cover[0] else None
+                elif field == "price":
+                    # Same as DRF's DecimalField with COERCE_DECIMAL_TO_STRING
+                    item[field] = f"{row[field]:f}"
+                else:
+                    item[field] = row[field]
+            data.append(item)
+        return data if self.many else data[0]
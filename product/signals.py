@@ -0,0 +1,69 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, invalidate_product
+from .images import release_blob
+from .models import Product, ProductImage, ProductStock
+
+
+# All invalidation runs after commit, so no request can re-cache pre-commit data
+
+_stock_batch = threading.local()
+
+
+@contextmanager
+def stock_batch():
+    """Skip the per-row ProductStock receivers on this thread.
+
+    For bulk stock writes: the caller refreshes the totals and invalidates
+    the caches once for the whole batch.
+    """
+    _stock_batch.active = True
+    try:
+        yield
+    finally:
+        _stock_batch.active = False
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+    transaction.on_commit(lambda: invalidate_product(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_image_cache(sender, instance, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+    transaction.on_commit(lambda: invalidate_product(instance.product_id, stock=False))
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def refresh_cover_image(sender, instance, **kwargs):
+    # Not deferred, like the stock totals below
+    Product.refresh_cover_images([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_image_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        transaction.on_commit(lambda: release_blob(instance.blob_id))
+
+
+@receiver([post_save, post_delete], sender=ProductStock)
+def refresh_stock_totals(sender, instance, **kwargs):
+    if getattr(_stock_batch, "active", False):
+        return
+    # Not deferred: the totals must land in the same transaction as the stock
+    Product.refresh_stock_totals([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=ProductStock)
+def invalidate_stock_cache(sender, instance, **kwargs):
+    if getattr(_stock_batch, "active", False):
+        return
+    transaction.on_commit(bump_catalog_version)
+    transaction.on_commit(lambda: invalidate_product(instance.product_id, detail=False))
@@ -1,3 +1,1532 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Prefetch, ProtectedError
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    RequestFactory,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from cart.models import Cart, CartItem
+
+from .admin import ProductStockInline
+from .checks import check_shared_cache
+from .cache import (
+    PRODUCT_DETAIL_KEY,
+    PRODUCT_STOCK_KEY,
+    bump_catalog_version,
+    get_catalog_version,
+)
+from .feeds import stream_feed
+from .filters import filter_products
+from .images import ImageDownloadError, _download, convert_to_webp
+from .importer import import_catalog
+from .models import ImageBlob, Product, ProductImage, ProductStock
+from .serializers import ProductReadSerializer, ProductSerializer
+from .views import ProductDetailView
+
+
+def seed_catalog(count):
+    categories = ["Men", "Women", "Kids"]
+    subcategories = ["Topwear", "Bottomwear"]
+    products = Product.objects.bulk_create(
+        Product(
+            name=f"Product {i}",
+            description=f"Description {i}",
+            price=Decimal(100 + i % 900),
+            category=categories[i % 3],
+            subcategory=subcategories[i % 2],
+            bestseller=i % 20 == 0,
+            show=i % 10 != 0,
+        )
+        for i in range(count)
+    )
+    ProductStock.objects.bulk_create(
+        ProductStock(product=product, size=size, quantity=quantity)
+        for i, product in enumerate(products)
+        for size, quantity in (("M", i % 4), ("XL", 1 if i % 50 == 0 else 0))
+    )
+    Product.refresh_stock_totals([product.pk for product in products])
+    ProductImage.objects.bulk_create(
+        ProductImage(product=product, image=f"product_images/{product.pk}-{n}.webp")
+        for i, product in enumerate(products)
+        for n in range(i % 3)
+    )
+    return products
+
+
+class ProductFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(60)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_filters_narrow_the_list(self):
+        response = APIClient().get(
+            "/api/products/",
+            {"category": "Men", "size": "M", "min_price": "110", "max_price": "150"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        expected = Product.objects.filter(
+            show=True,
+            category="Men",
+            price__gte=110,
+            price__lte=150,
+            stock_details__size="M",
+            stock_details__quantity__gt=0,
+        )
+        data = response.json()
+        self.assertEqual(sorted(p["id"] for p in data), sorted(p.id for p in expected))
+        self.assertTrue(data)
+
+    def test_invalid_filter_is_rejected(self):
+        response = APIClient().get("/api/products/", {"category": "Pets"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_price_outside_the_column_is_rejected(self):
+        for value in ("NaN", "-Infinity", "Infinity", "1e999999999", "100000000", "abc"):
+            for name in ("min_price", "max_price"):
+                with self.subTest(name=name, value=value):
+                    response = APIClient().get("/api/products/", {name: value})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {name: "Must be a number."})
+
+        response = APIClient().get("/api/products/", {"max_price": "99999999.99"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_extra_price_places_round_towards_the_range(self):
+        self.assertEqual(
+            filter_products(Product.objects.all(), {"min_price": "1e-999999999"}).count(),
+            Product.objects.filter(price__gte=Decimal("0.01")).count(),
+        )
+        for params, expected in (
+            ({"min_price": "109.001"}, Product.objects.filter(price__gte=110)),
+            ({"max_price": "109.999"}, Product.objects.filter(price__lte=109)),
+        ):
+            with self.subTest(params=params):
+                self.assertQuerySetEqual(
+                    filter_products(Product.objects.all(), params),
+                    expected,
+                    ordered=False,
+                )
+
+
+class ProductFilterIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(5000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE product_product")
+            cursor.execute("ANALYZE product_productstock")
+
+    def setUp(self):
+        # Keep the planner off sequential scans so the test checks that each
+        # filter matches an index definition rather than table-size costing
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, params, index_name):
+        queryset = filter_products(Product.objects.filter(show=True), params)
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_category_filter(self):
+        self.assertUsesIndex({"category": "Women"}, "product_show_category_idx")
+
+    def test_category_and_subcategory_filter(self):
+        self.assertUsesIndex(
+            {"category": "Women", "subcategory": "Topwear"}, "product_show_category_idx"
+        )
+
+    def test_subcategory_filter(self):
+        self.assertUsesIndex({"subcategory": "Topwear"}, "product_show_subcategory_idx")
+
+    def test_price_range_filter(self):
+        self.assertUsesIndex(
+            {"min_price": "200", "max_price": "250"}, "product_show_price_idx"
+        )
+
+    def test_bestseller_filter(self):
+        self.assertUsesIndex({"bestseller": "true"}, "product_show_bestseller_idx")
+
+    def test_size_filter(self):
+        self.assertUsesIndex({"size": "XL"}, "productstock_in_stock_idx")
+
+    def test_in_stock_listing(self):
+        for ordering, index_name in (
+            (["id"], "product_in_stock_id_idx"),
+            (["-bestseller", "id"], "product_in_stock_best_idx"),
+        ):
+            with self.subTest(ordering=ordering):
+                queryset = filter_products(
+                    Product.objects.filter(show=True), {"in_stock": "true"}
+                ).order_by(*ordering)[:24]
+                plan = queryset.explain()
+                self.assertIn(index_name, plan, plan)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, description, show in (
+            ("Cotton tee", "Soft linen blend", True),
+            ("Linen shirt", "Cool summer wear", True),
+            ("Red linen shirt", "Bright summer colour", True),
+            ("Linen trousers", "Retired style", False),
+        ):
+            Product.objects.create(
+                name=name, description=description, price=Decimal("499"),
+                category="Men", subcategory="Topwear", show=show,
+            )
+
+    def search(self, **params):
+        response = APIClient().get("/api/products/search/", params)
+        self.assertEqual(response.status_code, 200)
+        return [p["name"] for p in response.json()]
+
+    def test_name_matches_rank_above_description_matches(self):
+        names = self.search(q="linen")
+        self.assertEqual(sorted(names[:2]), ["Linen shirt", "Red linen shirt"])
+        self.assertEqual(names[2:], ["Cotton tee"])
+
+    def test_websearch_syntax(self):
+        self.assertEqual(self.search(q='"red linen"'), ["Red linen shirt"])
+        self.assertEqual(sorted(self.search(q="linen -red")), ["Cotton tee", "Linen shirt"])
+        self.assertEqual(self.search(q='shirt "unbalanced'), [])
+
+    def test_hidden_products_are_excluded(self):
+        self.assertEqual(self.search(q="trousers"), [])
+
+    def test_no_match_is_an_empty_page(self):
+        self.assertEqual(self.search(q="velvet"), [])
+
+    @override_settings(PRODUCT_MAX_PAGE_SIZE=2)
+    def test_page_size_is_bounded(self):
+        self.assertEqual(len(self.search(q="linen", page_size=50)), 2)
+        self.assertEqual(len(self.search(q="linen", page_size=0)), 1)
+        for params in ({"q": "linen", "page_size": "many"}, {"q": " "}, {}):
+            with self.subTest(params=params):
+                response = APIClient().get("/api/products/search/", params)
+                self.assertEqual(response.status_code, 400)
+
+
+class ProductSearchIndexTests(TransactionTestCase):
+    def setUp(self):
+        seed_catalog(5000)
+        # GIN cost estimates come from the index metapage, which only VACUUM
+        # updates, so this can't run inside a test transaction
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE product_product")
+
+    def test_search_uses_the_gin_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get("/api/products/search/", {"q": "42"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["name"] for p in response.json()], ["Product 42"])
+        (sql,) = [q["sql"] for q in queries if "search_vector" in q["sql"]]
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN " + sql)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("product_search_vector_idx", plan, plan)
+
+
+class ProductFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, category, price, sizes, bestseller, show in (
+            ("Tee", "Men", "499", {"M": 2, "L": 0}, True, True),
+            ("Shirt", "Men", "1500", {"L": 1}, False, True),
+            ("Dress", "Women", "5000", {"S": 3, "M": 1}, False, True),
+            ("Hoodie", "Kids", "999.99", {}, True, True),
+            ("Retired", "Men", "700", {"M": 9}, True, False),
+        ):
+            product = Product.objects.create(
+                name=name, description="Plain", price=Decimal(price), category=category,
+                subcategory="Topwear", bestseller=bestseller, show=show,
+            )
+            for size, quantity in sizes.items():
+                ProductStock.objects.create(product=product, size=size, quantity=quantity)
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, **params):
+        response = APIClient().get("/api/products/facets/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts(self):
+        facets = self.facets()
+        self.assertEqual(facets["total"], 4)
+        self.assertEqual(facets["category"], {"Men": 2, "Women": 1, "Kids": 1})
+        self.assertEqual(facets["subcategory"], {"Topwear": 4, "Bottomwear": 0})
+        self.assertEqual(facets["size"], {"S": 1, "M": 2, "L": 1, "XL": 0})
+        self.assertEqual(facets["bestseller"], {"true": 2, "false": 2})
+        self.assertEqual(
+            facets["price"],
+            {"0-500": 1, "500-1000": 1, "1000-2000": 1, "2000-5000": 0, "5000+": 1},
+        )
+
+    def test_filters_are_applied(self):
+        facets = self.facets(category="Men", size="M")
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual(facets["category"], {"Men": 1, "Women": 0, "Kids": 0})
+        self.assertEqual(facets["size"], {"S": 0, "M": 1, "L": 0, "XL": 0})
+        self.assertEqual(facets["price"]["0-500"], 1)
+
+    def test_one_query_cold_and_none_warm(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.facets()["total"], 4)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets()["total"], 4)
+
+        Product.objects.filter(name="Retired").update(show=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets()["total"], 4)
+        bump_catalog_version()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.facets()["total"], 5)
+
+
+class ProductPatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name="Tee", description="Plain", price=Decimal("499"),
+            category="Men", subcategory="Topwear",
+        )
+        for size, quantity in (("S", 1), ("M", 2), ("L", 3)):
+            ProductStock.objects.create(product=cls.product, size=size, quantity=quantity)
+        ProductImage.objects.create(product=cls.product, image="product_images/a.webp")
+
+    def setUp(self):
+        cache.clear()
+
+    def patch(self, data, client=None, **kwargs):
+        client = client or manager_client()
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.patch(f"/api/products/{self.product.pk}/", data, **kwargs)
+
+    def stock(self):
+        return dict(self.product.stock_details.values_list("size", "quantity"))
+
+    def test_partial_scalar_update(self):
+        response = self.patch({"price": "599.00", "bestseller": True}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.bestseller), (Decimal("599"), True))
+        self.assertEqual(self.product.name, "Tee")
+        self.assertEqual(self.stock(), {"S": 1, "M": 2, "L": 3})
+
+    def test_stock_added_changed_and_removed(self):
+        response = self.patch(
+            {"stock_details": [{"size": "M", "quantity": 5}, {"size": "L", "quantity": 3},
+                               {"size": "XL", "quantity": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), {"M": 5, "L": 3, "XL": 1})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 9)
+        self.assertEqual(
+            [(s["size"], s["quantity"]) for s in response.data["stock_details"]],
+            [("M", 5), ("L", 3), ("XL", 1)],
+        )
+
+    def test_stock_writes_do_not_grow_with_sizes(self):
+        client = manager_client()
+
+        def statements(stock_details):
+            with CaptureQueriesContext(connection) as queries:
+                self.patch({"stock_details": stock_details}, client=client, format="json")
+            return [q["sql"].split()[0] for q in queries]
+
+        one = statements([{"size": "S", "quantity": 1}, {"size": "M", "quantity": 2},
+                          {"size": "XL", "quantity": 1}])
+        # Back to three sizes, then change every one, add one and drop two
+        statements([{"size": "S", "quantity": 1}, {"size": "M", "quantity": 2},
+                    {"size": "L", "quantity": 3}])
+        many = statements([{"size": "S", "quantity": 7}, {"size": "XL", "quantity": 1}])
+        self.assertEqual(one, many)
+        self.assertEqual(many.count("INSERT"), 1)
+        # One for the cart items of the dropped sizes, one for the stock
+        self.assertEqual(many.count("DELETE"), 2)
+
+    def test_removed_size_leaves_carts(self):
+        cart = Cart.objects.create(user=get_user_model().objects.create(username="shopper"))
+        for size in ("S", "M"):
+            CartItem.objects.create(cart=cart, product_id=self.product, size=size, quantity=1)
+
+        response = self.patch({"stock_details": [{"size": "M", "quantity": 2}]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(CartItem.objects.values_list("size", flat=True)), ["M"])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 2)
+
+    def test_duplicate_sizes_are_rejected(self):
+        response = self.patch(
+            {"stock_details": [{"size": "S", "quantity": 1}, {"size": "S", "quantity": 5}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"stock_details": ["Each size may only appear once."]}
+        )
+        self.assertEqual(self.stock(), {"S": 1, "M": 2, "L": 3})
+
+    def test_stock_details_as_json_string(self):
+        response = self.patch(
+            {"stock_details": json.dumps([{"size": "S", "quantity": 4}])}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), {"S": 4})
+
+        response = self.patch({"stock_details": "[{"}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_values_are_rejected(self):
+        for data in (
+            {"stock_details": [{"size": "XXL", "quantity": 1}]},
+            {"stock_details": [{"size": "S", "quantity": -1}]},
+            {"stock_details": [{"size": "S", "quantity": "many"}]},
+            {"price": "free"},
+            {"category": "Pets"},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.patch(data, format="json").status_code, 400)
+        self.assertEqual(self.stock(), {"S": 1, "M": 2, "L": 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal("499"))
+
+    def test_non_manager_is_forbidden(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create(username="shopper"))
+        response = self.patch({"price": "1.00"}, client=client, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.patch({"price": "1.00"}, client=APIClient(), format="json")
+                         .status_code, 403)
+
+    def test_response_matches_fresh_get(self):
+        APIClient().get(f"/api/products/{self.product.pk}/")  # warm the cache
+        response = self.patch(
+            {"name": "Linen tee", "stock_details": [{"size": "M", "quantity": 4},
+                                                    {"size": "XL", "quantity": 2}]},
+            format="json",
+        )
+        fresh = APIClient().get(f"/api/products/{self.product.pk}/")
+        self.assertEqual(
+            JSONRenderer().render(response.data), JSONRenderer().render(fresh.json())
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(40)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_walks_every_page_once(self):
+        for ordering, fields in (("id", ("id",)), ("bestseller", ("-bestseller", "id"))):
+            with self.subTest(ordering=ordering):
+                expected = list(
+                    Product.objects.filter(show=True)
+                    .order_by(*fields)
+                    .values_list("id", flat=True)
+                )
+                seen = []
+                response = APIClient().get(
+                    "/api/products/", {"ordering": ordering, "page_size": 7}
+                )
+                while True:
+                    data = response.json()
+                    self.assertLessEqual(len(data["results"]), 7)
+                    seen += [p["id"] for p in data["results"]]
+                    if data["next"] is None:
+                        break
+                    response = APIClient().get(data["next"])
+                self.assertEqual(seen, expected)
+
+    def test_unpaginated_list_follows_ordering(self):
+        for ordering, fields in (("id", ("id",)), ("bestseller", ("-bestseller", "id"))):
+            with self.subTest(ordering=ordering):
+                data = APIClient().get("/api/products/", {"ordering": ordering}).json()
+                self.assertEqual(
+                    [p["id"] for p in data],
+                    list(
+                        Product.objects.filter(show=True)
+                        .order_by(*fields)
+                        .values_list("id", flat=True)
+                    ),
+                )
+        response = APIClient().get("/api/products/", {"ordering": "price"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_last_page_has_no_next(self):
+        visible = Product.objects.filter(show=True).count()
+        data = APIClient().get("/api/products/", {"page_size": visible}).json()
+        self.assertEqual(len(data["results"]), visible)
+        self.assertIsNone(data["next"])
+
+    def test_bad_cursors_are_rejected(self):
+        def encode(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        for ordering, cursor in (
+            ("id", "not base64!"),
+            ("id", encode({"id": 1})),
+            ("id", encode([1, 2])),
+            ("id", encode(["abc"])),
+            ("id", encode([{"a": 1}])),
+            ("id", encode([True])),
+            ("id", encode([1.5])),
+            ("bestseller", encode([1, 5])),
+            ("bestseller", encode([True, "5"])),
+        ):
+            with self.subTest(ordering=ordering, cursor=cursor):
+                response = APIClient().get(
+                    "/api/products/", {"ordering": ordering, "cursor": cursor}
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.json())
+
+
+class StockTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name="Tee", description="Plain", price=Decimal("499"),
+            category="Men", subcategory="Topwear",
+        )
+
+    def assertTotals(self, total_stock, in_stock):
+        self.product.refresh_from_db(fields=["total_stock", "in_stock"])
+        self.assertEqual(
+            (self.product.total_stock, self.product.in_stock), (total_stock, in_stock)
+        )
+
+    def test_stock_saves_and_deletes_update_totals(self):
+        self.assertTotals(0, False)
+        medium = ProductStock.objects.create(product=self.product, size="M", quantity=3)
+        ProductStock.objects.create(product=self.product, size="L", quantity=2)
+        self.assertTotals(5, True)
+
+        medium.quantity = 0
+        medium.save(update_fields=["quantity"])
+        self.assertTotals(2, True)
+
+        ProductStock.objects.get(product=self.product, size="L").delete()
+        self.assertTotals(0, False)
+
+    def test_bulk_stock_upsert_updates_totals(self):
+        ProductStock.objects.create(product=self.product, size="M", quantity=3)
+        ProductDetailView().apply_stock(
+            self.product, list(self.product.stock_details.all()), {"M": 1, "XL": 4}
+        )
+        self.assertTotals(5, True)
+
+    def test_admin_size_delete_keeps_order_history(self):
+        from orderItem.models import Order, OrderItem
+
+        medium = ProductStock.objects.create(product=self.product, size="M", quantity=3)
+        large = ProductStock.objects.create(product=self.product, size="L", quantity=2)
+        user = get_user_model().objects.create(username="admin", is_superuser=True, is_staff=True)
+        order = Order.objects.create(user=user)
+        OrderItem.objects.create(order=order, product=self.product, size="M", quantity=1)
+        OrderItem.objects.create(order=order, product=self.product, size="L", quantity=1)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product_id=self.product, size="M")
+        CartItem.objects.create(cart=cart, product_id=self.product, size="L")
+
+        request = RequestFactory().post("/")
+        request.user = user
+        FormSet = ProductStockInline(Product, admin.site).get_formset(request, self.product)
+        prefix = FormSet.get_default_prefix()
+        data = {f"{prefix}-TOTAL_FORMS": "2", f"{prefix}-INITIAL_FORMS": "2"}
+        for i, stock in enumerate([medium, large]):
+            data.update({
+                f"{prefix}-{i}-id": stock.pk,
+                f"{prefix}-{i}-product": self.product.pk,
+                f"{prefix}-{i}-size": stock.size,
+                f"{prefix}-{i}-quantity": stock.quantity,
+            })
+        data[f"{prefix}-0-DELETE"] = "on"
+        formset = FormSet(data, instance=self.product)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        formset.save()
+
+        self.assertEqual(list(self.product.stock_details.values_list("size", flat=True)), ["L"])
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(list(CartItem.objects.values_list("size", flat=True)), ["L"])
+        self.assertTotals(2, True)
+
+    def test_in_stock_filter(self):
+        ProductStock.objects.create(product=self.product, size="M", quantity=1)
+        Product.objects.create(
+            name="Sold out", description="", price=Decimal("1"),
+            category="Men", subcategory="Topwear",
+        )
+        response = APIClient().get("/api/products/", {"in_stock": "true"})
+        self.assertEqual([p["id"] for p in response.json()], [self.product.pk])
+
+    def test_check_stock_totals_repairs_drift(self):
+        ProductStock.objects.create(product=self.product, size="M", quantity=3)
+        Product.objects.filter(pk=self.product.pk).update(total_stock=9, in_stock=False)
+
+        call_command("check_stock_totals", stdout=io.StringIO())
+        self.assertTotals(9, False)
+
+        out = io.StringIO()
+        call_command("check_stock_totals", "--repair", stdout=out)
+        self.assertTotals(3, True)
+        self.assertIn("repaired 1", out.getvalue())
+
+
+class CoverImageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name="Tee", description="Plain", price=Decimal("499"),
+            category="Men", subcategory="Topwear",
+        )
+
+    def assertCover(self, image):
+        self.product.refresh_from_db(fields=["cover_image"])
+        self.assertEqual(self.product.cover_image_id, image and image.pk)
+
+    def test_image_saves_and_deletes_update_cover(self):
+        pending = ProductImage.objects.create(
+            product=self.product, image="", status=ProductImage.PROCESSING
+        )
+        self.assertCover(None)
+        second = ProductImage.objects.create(product=self.product, image="product_images/b.webp")
+        self.assertCover(second)
+
+        pending.image = "product_images/a.webp"
+        pending.status = ProductImage.READY
+        pending.save()
+        self.assertCover(pending)
+
+        pending.delete()
+        self.assertCover(second)
+        second.delete()
+        self.assertCover(None)
+
+    def test_card_fields_need_no_image_query(self):
+        image = ProductImage.objects.create(product=self.product, image="product_images/a.webp")
+        with self.assertNumQueries(1):
+            response = APIClient().get("/api/products/", {"fields": "id,name,price,cover_image"})
+        card = response.json()[0]
+        self.assertEqual(card["cover_image"]["id"], image.pk)
+        self.assertEqual(card["cover_image"]["image"], "/media/product_images/a.webp")
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(10)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matching_etag_returns_304_without_queries(self):
+        client = APIClient()
+        etag = client.get("/api/products/")["ETag"]
+
+        with self.assertNumQueries(0):
+            response = client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_product_change_bumps_version_and_etag(self):
+        client = APIClient()
+        etag = client.get("/api/products/")["ETag"]
+        version = get_catalog_version()
+
+        product = Product.objects.filter(show=True).first()
+        product.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+
+        self.assertGreater(get_catalog_version(), version)
+        response = client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("Renamed", [p["name"] for p in response.json()])
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def test_local_memory_cache_is_flagged_outside_debug(self):
+        for debug, local, expected in (
+            (False, True, ["product.W001"]),
+            (False, False, []),
+            (True, True, []),
+        ):
+            with self.subTest(debug=debug, local=local), self.settings(
+                DEBUG=debug, LOCAL_CACHE=local
+            ):
+                self.assertEqual([w.id for w in check_shared_cache(None)], expected)
+
+
+class ProductDetailCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = seed_catalog(2)
+
+    def setUp(self):
+        cache.clear()
+        for product in (self.first, self.second):
+            APIClient().get(f"/api/products/{product.pk}/")
+
+    def cached(self, product):
+        return (
+            cache.get(PRODUCT_DETAIL_KEY.format(pk=product.pk)) is not None,
+            cache.get(PRODUCT_STOCK_KEY.format(pk=product.pk)) is not None,
+        )
+
+    def test_warm_detail_runs_no_queries(self):
+        with self.assertNumQueries(0):
+            response = APIClient().get(f"/api/products/{self.first.pk}/")
+        self.assertEqual(response.json()["id"], self.first.pk)
+
+    def test_image_save_clears_only_that_detail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.first, image="product_images/a.webp")
+        self.assertEqual(self.cached(self.first), (False, True))
+        self.assertEqual(self.cached(self.second), (True, True))
+
+        data = APIClient().get(f"/api/products/{self.first.pk}/").json()
+        self.assertEqual(data["images"][0]["image"], "/media/product_images/a.webp")
+
+    def test_stock_save_clears_only_that_stock(self):
+        stock = self.first.stock_details.get(size="M")
+        stock.quantity = 40
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.save()
+        self.assertEqual(self.cached(self.first), (True, False))
+        self.assertEqual(self.cached(self.second), (True, True))
+
+        # Only the stock portion is read back
+        with self.assertNumQueries(1):
+            data = APIClient().get(f"/api/products/{self.first.pk}/").json()
+        self.assertIn({"id": stock.pk, "size": "M", "quantity": 40}, data["stock_details"])
+
+
+@unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run")
+class CatalogCacheBenchmark(TestCase):
+    requests = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(1000)
+
+    def _throughput(self, before_each=None, **headers):
+        client = APIClient()
+        started = time.perf_counter()
+        for _ in range(self.requests):
+            if before_each:
+                before_each()
+            client.get("/api/products/", **headers)
+        return self.requests / (time.perf_counter() - started)
+
+    def test_cold_vs_warm(self):
+        cache.clear()
+        cold = self._throughput(before_each=bump_catalog_version)
+        etag = APIClient().get("/api/products/")["ETag"]
+        warm = self._throughput()
+        revalidate = self._throughput(HTTP_IF_NONE_MATCH=etag)
+
+        print(
+            f"\n/api/products/ with 1000 products: cold {cold:.1f} req/s, "
+            f"warm {warm:.1f} req/s, 304 {revalidate:.1f} req/s"
+        )
+        self.assertGreater(warm, cold)
+
+
+def render_both(fields=None, queryset=None):
+    queryset = queryset if queryset is not None else Product.objects.order_by("id")
+    # ProductReadSerializer emits nested rows in id order; pin the DRF side to it
+    drf = ProductSerializer(
+        queryset.prefetch_related(
+            Prefetch("stock_details", ProductStock.objects.order_by("id")),
+            Prefetch("images", ProductImage.objects.order_by("id")),
+        ),
+        many=True,
+        fields=fields,
+    ).data
+    fast = ProductReadSerializer(
+        queryset.values(*ProductReadSerializer.columns(fields)), many=True, fields=fields
+    ).data
+    return JSONRenderer().render(drf), JSONRenderer().render(fast)
+
+
+class ProductReadSerializerParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(30)
+        Product.objects.create(
+            name="Kurta — “festive” ✨",
+            description="Line one\nline \"two\"",
+            price=Decimal("1234567.50"),
+            category="Women",
+            subcategory="Topwear",
+        )
+        ProductImage.objects.create(product=Product.objects.first(), image="")
+        ProductImage.objects.create(
+            product=Product.objects.first(), image="", status=ProductImage.FAILED
+        )
+        ProductImage.objects.create(
+            product=Product.objects.first(),
+            image="product_images/a.webp",
+            placeholder="data:image/webp;base64,UklGRg==",
+            variants={
+                "large": {"name": "product_images/a_large.webp", "width": 1200, "height": 900},
+                "thumb": {"name": "product_images/a_thumb.webp", "width": 200, "height": 150},
+                "medium": {"name": "product_images/a_medium.webp", "width": 600, "height": 450},
+            },
+        )
+
+    def test_full_representation_is_byte_identical(self):
+        drf, fast = render_both()
+        self.assertEqual(drf, fast)
+
+    def test_sparse_representation_is_byte_identical(self):
+        for fields in (["id", "name", "price", "images"], ["id", "stock_details"], ["id"]):
+            with self.subTest(fields=fields):
+                drf, fast = render_both(fields)
+                self.assertEqual(drf, fast)
+
+    def test_failed_images_are_left_out(self):
+        product = Product.objects.first()
+        Product.objects.filter(pk=product.pk).update(show=True)
+        failed = ProductImage.objects.get(status=ProductImage.FAILED)
+        for data in (
+            APIClient().get(f"/api/products/{product.pk}/").json(),
+            next(p for p in APIClient().get("/api/products/").json() if p["id"] == product.pk),
+            ProductSerializer(product).data,
+        ):
+            ids = [image["id"] for image in data["images"]]
+            self.assertEqual(len(ids), 2)
+            self.assertNotIn(failed.pk, ids)
+
+    def test_detail_is_byte_identical(self):
+        product = Product.objects.last()
+        drf = ProductSerializer(product).data
+        fast = ProductReadSerializer(
+            Product.objects.filter(pk=product.pk).values(*ProductReadSerializer.columns()).get()
+        ).data
+        self.assertEqual(JSONRenderer().render(drf), JSONRenderer().render(fast))
+
+
+@unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run")
+class ProductReadSerializerBenchmark(TestCase):
+    def _time(self, render, rounds=3):
+        best = float("inf")
+        for _ in range(rounds):
+            started = time.perf_counter()
+            render()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def test_serialize_1k_and_10k(self):
+        for count in (1000, 10000):
+            Product.objects.all().delete()
+            seed_catalog(count)
+            queryset = Product.objects.order_by("id")
+            drf = self._time(
+                lambda: JSONRenderer().render(
+                    ProductSerializer(
+                        queryset.prefetch_related("stock_details", "images"), many=True
+                    ).data
+                )
+            )
+            fast = self._time(
+                lambda: JSONRenderer().render(
+                    ProductReadSerializer(
+                        queryset.values(*ProductReadSerializer.columns()), many=True
+                    ).data
+                )
+            )
+            print(
+                f"\n{count} products: ProductSerializer {drf * 1000:.0f} ms, "
+                f"ProductReadSerializer {fast * 1000:.0f} ms ({drf / fast:.1f}x)"
+            )
+            self.assertLess(fast, drf)
+
+
+class CatalogFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(30)
+
+    def get_feed(self, fmt):
+        response = manager_client().get(f"/api/products/feed/{fmt}/")
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_matches_catalog_representation(self):
+        lines = self.get_feed("ndjson").splitlines()
+        expected = ProductReadSerializer(
+            Product.objects.filter(show=True).order_by("id").values(
+                *ProductReadSerializer.columns()
+            ),
+            many=True,
+        ).data
+        feed = [json.loads(line) for line in lines]
+        self.assertEqual([p["id"] for p in feed], [p["id"] for p in expected])
+        self.assertEqual(feed[1]["stock_details"], expected[1]["stock_details"])
+        self.assertTrue(feed[1]["images"][0]["image"].startswith("http://testserver/"))
+
+    def test_csv_uses_import_columns(self):
+        rows = list(csv.DictReader(io.StringIO(self.get_feed("csv"))))
+        self.assertEqual(len(rows), Product.objects.filter(show=True).count())
+        product = Product.objects.get(pk=rows[2]["id"])
+        self.assertEqual(rows[2]["name"], product.name)
+        self.assertEqual(
+            rows[2]["stock_M"], str(product.stock_details.get(size="M").quantity)
+        )
+
+    def test_xml_is_well_formed(self):
+        root = ElementTree.fromstring(self.get_feed("xml"))
+        items = root.findall("channel/item")
+        self.assertEqual(len(items), Product.objects.filter(show=True).count())
+        ns = {"g": "http://base.google.com/ns/1.0"}
+        self.assertTrue(items[0].find("g:price", ns).text.endswith(" INR"))
+
+    def test_chunks_keep_queries_per_chunk_constant(self):
+        # One cursor query for products plus stock and images per chunk
+        with self.assertNumQueries(1 + 2 * 3):
+            list(stream_feed("ndjson", chunk_size=10))
+
+    def test_unknown_format(self):
+        response = manager_client().get("/api/products/feed/yaml/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_needs_manager_or_feed_token(self):
+        url = "/api/products/feed/ndjson/"
+        self.assertEqual(APIClient().get(url).status_code, 403)
+        self.assertEqual(APIClient().get(url, {"token": ""}).status_code, 403)
+        with self.settings(CATALOG_FEED_TOKEN="s3cret"):
+            self.assertEqual(APIClient().get(url, {"token": "guess"}).status_code, 403)
+            self.assertEqual(APIClient().get(url, {"token": "s3cret"}).status_code, 200)
+
+
+class ProductBatchLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = seed_catalog(12)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_preserves_order_and_reports_missing(self):
+        ids = [self.products[5].pk, self.products[2].pk, 999999, self.products[9].pk]
+        response = APIClient().get("/api/products/", {"ids": ",".join(map(str, ids))})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([p["id"] for p in data["results"]], [ids[0], ids[1], ids[3]])
+        self.assertEqual(data["missing"], [999999])
+        detail = APIClient().get(f"/api/products/{ids[1]}/").json()
+        self.assertEqual(data["results"][1], detail)
+
+    def test_ten_items_cost_constant_queries(self):
+        ids = ",".join(str(p.pk) for p in self.products[:10])
+        # products, images, stock
+        with self.assertNumQueries(3):
+            APIClient().get("/api/products/", {"ids": ids})
+        with self.assertNumQueries(0):
+            APIClient().get("/api/products/", {"ids": ids})
+
+    def test_invalid_ids(self):
+        response = APIClient().get("/api/products/", {"ids": "1,two"})
+        self.assertEqual(response.status_code, 400)
+
+
+def make_upload(name="photo.jpg", size=(64, 48), marker=None):
+    # marker: an (r, g, b) corner pixel, to make otherwise equal uploads differ
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    if marker:
+        img.paste(marker, (0, 0, 8, 8))
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+def manager_client():
+    client = APIClient()
+    client.force_authenticate(
+        get_user_model().objects.get_or_create(username="manager", role="manager")[0]
+    )
+    return client
+
+
+def product_form(images):
+    return {
+        "name": "Linen shirt",
+        "description": "Breathable",
+        "price": "1299.00",
+        "category": "Men",
+        "subcategory": "Topwear",
+        "stock_details": json.dumps([{"size": "M", "quantity": 2}]),
+        "images": images,
+    }
+
+
+CSV_HEADER = "name,description,price,category,subcategory,stock_M,stock_L,images\n"
+
+
+def csv_row(name, price="499", stock_m="2", stock_l="", images=""):
+    return f"{name},Plain,{price},Men,Topwear,{stock_m},{stock_l},{images}\n"
+
+
+@override_settings(PRODUCT_IMAGE_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp())
+class ImportCatalogTests(TestCase):
+    def post(self, name, content):
+        return manager_client().post(
+            "/api/products/import/",
+            {"file": SimpleUploadedFile(name, content)},
+            format="multipart",
+        )
+
+    def import_csv(self, text, **kwargs):
+        with patch("product.importer.queue_image_imports", return_value=[]) as queue:
+            report, _ = import_catalog(io.StringIO(text), "csv", **kwargs)
+        return report, [job for call in queue.call_args_list for job in call.args[0]]
+
+    def test_csv_rows_create_products_stock_and_totals(self):
+        report, jobs = self.import_csv(
+            CSV_HEADER
+            + csv_row("Tee", stock_m="2", stock_l="3", images="https://cdn.example/a.jpg")
+            + csv_row("Sold out", stock_m="0")
+        )
+        self.assertEqual(report, {"created": 2, "errors": [], "images_queued": 1})
+        tee = Product.objects.get(name="Tee")
+        self.assertEqual(
+            dict(tee.stock_details.values_list("size", "quantity")), {"M": 2, "L": 3}
+        )
+        self.assertEqual((tee.total_stock, tee.in_stock), (5, True))
+        sold_out = Product.objects.get(name="Sold out")
+        self.assertEqual((sold_out.total_stock, sold_out.in_stock), (0, False))
+        self.assertEqual(jobs, [(tee.pk, "https://cdn.example/a.jpg")])
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        report, _ = self.import_csv(
+            CSV_HEADER
+            + csv_row("Tee")
+            + csv_row("Bad price", price="cheap")
+            + csv_row("Bad size").replace(",Men,", ",Pets,")
+        )
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(
+            [(e["row"], sorted(e["errors"])) for e in report["errors"]],
+            [(3, ["price"]), (4, ["category"])],
+        )
+
+    def test_rows_are_written_chunk_by_chunk(self):
+        rows = "".join(csv_row(f"Tee {i}") for i in range(5))
+        with patch("product.importer.bump_catalog_version") as bump:
+            # A chunk of invalid rows only: nothing to write
+            report, _ = self.import_csv(
+                CSV_HEADER + csv_row("x", price="?") + csv_row("y", price="?") + rows,
+                chunk_size=2,
+            )
+        self.assertEqual(report["created"], 5)
+        self.assertEqual(bump.call_count, 3)
+
+    def test_jsonl_rows(self):
+        row = {
+            "name": "Tee", "description": "Plain", "price": "499", "category": "Men",
+            "subcategory": "Topwear", "stock_details": [{"size": "S", "quantity": 4}],
+        }
+        text = "\n".join(
+            [json.dumps(row), "", "{not json", "[1, 2]", json.dumps({**row, "price": "x"})]
+        )
+        report, _ = import_catalog(io.StringIO(text), "jsonl")
+        self.assertEqual(report["created"], 1)
+        self.assertEqual([e["row"] for e in report["errors"]], [3, 4, 5])
+        self.assertEqual(Product.objects.get().total_stock, 4)
+
+    def test_local_paths_need_allow_paths(self):
+        text = CSV_HEADER + csv_row("Tee", images="/srv/photos/tee.jpg")
+        report, jobs = self.import_csv(text)
+        self.assertEqual(report["created"], 0)
+        self.assertIn("images", report["errors"][0]["errors"])
+
+        report, jobs = self.import_csv(text, allow_paths=True)
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(jobs, [(Product.objects.get().pk, "/srv/photos/tee.jpg")])
+
+    def test_import_catalog_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as fh:
+            fh.write(CSV_HEADER + csv_row("Tee") + csv_row("Bad", price="?"))
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_catalog", fh.name, stdout=out, stderr=err)
+        os.unlink(fh.name)
+        self.assertIn("Created 1 products, 1 rows failed.", out.getvalue())
+        self.assertIn("Row 3:", err.getvalue())
+
+    def test_endpoint_rejects_paths_and_unknown_formats(self):
+        response = self.post(
+            "catalog.csv", (CSV_HEADER + csv_row("Tee", images="/etc/passwd")).encode()
+        )
+        self.assertEqual(response.data["created"], 0)
+        self.assertEqual(self.post("catalog.xlsx", b"").status_code, 400)
+
+    def test_large_files_are_sent_to_the_command(self):
+        with override_settings(PRODUCT_IMPORT_MAX_UPLOAD_SIZE=100):
+            response = self.post("catalog.csv", (CSV_HEADER + csv_row("Tee") * 5).encode())
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("import_catalog", response.data["file"])
+        self.assertFalse(Product.objects.exists())
+
+    def test_download_refuses_private_addresses(self):
+        with patch("product.images.requests.get") as get:
+            for url in (
+                "http://127.0.0.1/a.jpg",
+                "http://10.1.2.3/a.jpg",
+                "http://169.254.169.254/latest/meta-data",
+                "http://[::1]/a.jpg",
+            ):
+                with self.subTest(url=url), self.assertRaises(ImageDownloadError):
+                    _download(url)
+        get.assert_not_called()
+
+    def test_download_checks_redirects_and_size(self):
+        def response(status=200, headers=None, body=b""):
+            fake = MagicMock(is_redirect=status in (301, 302), headers=headers or {})
+            fake.iter_content.return_value = [body[i:i + 40] for i in range(0, len(body), 40)]
+            return fake
+
+        temp_dir = tempfile.mkdtemp()
+        public = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.215.14", 0))]
+        loopback = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))]
+        with patch("product.images.socket.getaddrinfo", return_value=public), override_settings(
+            PRODUCT_IMAGE_MAX_DOWNLOAD_SIZE=100, FILE_UPLOAD_TEMP_DIR=temp_dir
+        ), patch("product.images.requests.get") as get:
+            get.return_value = response(body=b"x" * 100)
+            with open(_download("https://cdn.example/a.jpg"), "rb") as fh:
+                self.assertEqual(len(fh.read()), 100)
+
+            get.return_value = response(body=b"x" * 101)
+            with self.assertRaises(ImageDownloadError):
+                _download("https://cdn.example/a.jpg")
+            get.return_value = response(headers={"content-length": "5000"})
+            with self.assertRaises(ImageDownloadError):
+                _download("https://cdn.example/a.jpg")
+
+            get.return_value = response(302, {"location": "http://127.0.0.1/a.jpg"})
+            with patch(
+                "product.images.socket.getaddrinfo",
+                side_effect=[public, loopback],
+            ), self.assertRaises(ImageDownloadError):
+                _download("https://cdn.example/a.jpg")
+        # Only the completed download is left behind
+        self.assertEqual(len(os.listdir(temp_dir)), 1)
+
+    def test_undecodable_and_malformed_rows_are_reported(self):
+        content = (
+            (CSV_HEADER + csv_row("Tee")).encode()
+            + csv_row("Caf\xe9", price="1").encode("latin-1")
+            + f'"{"x" * 200_000}",Plain,1,Men,Topwear,1,,\n'.encode()
+            + csv_row("Polo").encode()
+        )
+        response = self.post("catalog.csv", content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([e["row"] for e in response.data["errors"]], [3, 4])
+        self.assertIn("UTF-8", response.data["errors"][0]["errors"]["non_field_errors"][0])
+        self.assertIn("Invalid CSV", response.data["errors"][1]["errors"]["non_field_errors"][0])
+        self.assertEqual(
+            set(Product.objects.values_list("name", flat=True)), {"Tee", "Polo"}
+        )
+
+    def test_undecodable_jsonl_line_is_reported(self):
+        good = {"name": "Tee", "description": "Plain", "price": "1", "category": "Men",
+                "subcategory": "Topwear"}
+        content = (
+            json.dumps(good).encode() + b"\n"
+            + json.dumps({**good, "name": "Caf\xe9"}, ensure_ascii=False).encode("latin-1")
+            + b"\n"
+        )
+        response = self.post("catalog.jsonl", content)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["errors"][0]["row"], 2)
+
+
+@override_settings(PRODUCT_IMAGE_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp())
+class ProductUploadTests(TestCase):
+    def test_images_convert_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = manager_client().post(
+                "/api/products/",
+                product_form([make_upload("a.jpg"), make_upload("b.png")]),
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 201)
+        product = Product.objects.get(name="Linen shirt")
+        self.assertEqual(
+            set(product.images.values_list("status", flat=True)), {ProductImage.PROCESSING}
+        )
+
+        for callback in callbacks:
+            callback()
+
+        images = list(product.images.order_by("id"))
+        self.assertEqual([i.status for i in images], [ProductImage.READY] * 2)
+        self.assertTrue(images[0].image.name.endswith("a.webp"))
+        with Image.open(images[1].image.path) as converted:
+            self.assertEqual(converted.format, "WEBP")
+
+    def test_variants_are_width_bounded_and_exposed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            manager_client().post(
+                "/api/products/",
+                product_form([make_upload("wide.jpg", size=(1600, 1000))]),
+                format="multipart",
+            )
+        image = ProductImage.objects.get()
+        widths = {name: v["width"] for name, v in image.variants.items()}
+        self.assertEqual(widths, {"large": 1200, "medium": 600, "thumb": 200})
+        with image.image.storage.open(image.variants["thumb"]["name"]) as fh:
+            self.assertEqual(Image.open(fh).size, (200, 125))
+
+        data = APIClient().get(f"/api/products/{image.product_id}/").json()["images"][0]
+        self.assertEqual(list(data["variants"]), ["thumb", "medium", "large"])
+        self.assertEqual(
+            data["srcset"].split(", ")[0], f"{data['variants']['thumb']} 200w"
+        )
+
+    def test_backfill_image_variants(self):
+        product = Product.objects.create(
+            name="Old", description="", price=1, category="Men", subcategory="Topwear"
+        )
+        image = ProductImage(product=product)
+        image.image.save("old.webp", convert_to_webp(make_upload(size=(300, 300))))
+
+        out = io.StringIO()
+        call_command("backfill_image_variants", "--threads=0", stdout=out)
+        image.refresh_from_db()
+        self.assertEqual(
+            {name: v["width"] for name, v in image.variants.items()},
+            {"large": 300, "medium": 300, "thumb": 200},
+        )
+        self.assertIn("Backfilled 1 images", out.getvalue())
+
+        # Already done: nothing left to pick up
+        out = io.StringIO()
+        call_command("backfill_image_variants", "--threads=0", stdout=out)
+        self.assertIn("Backfilled 0 images", out.getvalue())
+
+    def test_placeholder_is_inlined(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            manager_client().post(
+                "/api/products/",
+                product_form([make_upload("wide.jpg", size=(1600, 1000))]),
+                format="multipart",
+            )
+        image = ProductImage.objects.get()
+        prefix = "data:image/webp;base64,"
+        self.assertTrue(image.placeholder.startswith(prefix))
+        preview = Image.open(io.BytesIO(base64.b64decode(image.placeholder[len(prefix):])))
+        self.assertEqual(preview.size, (16, 10))
+        self.assertLess(len(image.placeholder), 400)
+
+        data = APIClient().get(f"/api/products/{image.product_id}/").json()
+        self.assertEqual(data["images"][0]["placeholder"], image.placeholder)
+
+    def test_backfill_image_placeholders(self):
+        product = Product.objects.create(
+            name="Old", description="", price=1, category="Men", subcategory="Topwear"
+        )
+        image = ProductImage(product=product)
+        image.image.save("old.webp", convert_to_webp(make_upload(size=(300, 200))))
+
+        out = io.StringIO()
+        call_command("backfill_image_placeholders", "--threads=0", stdout=out)
+        image.refresh_from_db()
+        self.assertTrue(image.placeholder.startswith("data:image/webp;base64,"))
+        self.assertIn("Backfilled 1 images", out.getvalue())
+
+    def test_recover_image_conversions(self):
+        product = Product.objects.create(
+            name="Tee", description="", price=1, category="Men", subcategory="Topwear"
+        )
+        lost = ProductImage.objects.create(
+            product=product,
+            image="",
+            status=ProductImage.PROCESSING,
+            created_at=timezone.now() - timedelta(hours=1),
+        )
+        running = ProductImage.objects.create(
+            product=product, image="", status=ProductImage.PROCESSING
+        )
+        temp_dir = tempfile.mkdtemp()
+        names = ["product-image-old.jpg", "product-image-new.jpg", "other.jpg"]
+        for name in names:
+            open(os.path.join(temp_dir, name), "w").close()
+        an_hour_ago = time.time() - 3600
+        for name in (names[0], names[2]):
+            os.utime(os.path.join(temp_dir, name), (an_hour_ago, an_hour_ago))
+
+        out = io.StringIO()
+        with self.settings(FILE_UPLOAD_TEMP_DIR=temp_dir):
+            call_command("recover_image_conversions", stdout=out)
+        self.assertIn("Deleted 1 lost conversions, removed 1 temp files.", out.getvalue())
+        self.assertFalse(ProductImage.objects.filter(pk=lost.pk).exists())
+        running.refresh_from_db()
+        self.assertEqual(running.status, ProductImage.PROCESSING)
+        self.assertEqual(sorted(os.listdir(temp_dir)), sorted(names[1:]))
+
+    def test_reencode_images_resumes_from_checkpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                manager_client().post(
+                    "/api/products/", product_form([make_upload()]), format="multipart"
+                )
+        shared = list(ProductImage.objects.order_by("id"))
+        legacy = ProductImage(product=shared[0].product)
+        legacy.image.save("old.webp", convert_to_webp(make_upload(size=(300, 200))))
+        storage = legacy.image.storage
+        old_names = [shared[0].image.name, legacy.image.name]
+
+        checkpoint = os.path.join(tempfile.mkdtemp(), "reencode.checkpoint")
+        args = ["--threads=0", "--writes-per-second=0", f"--checkpoint={checkpoint}"]
+        # A killed run that finished the shared blob
+        with open(checkpoint, "w") as fh:
+            json.dump({"last_pk": shared[0].pk}, fh)
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("reencode_images", *args, stdout=out)
+        self.assertIn(f"Resuming after image {shared[0].pk}", out.getvalue())
+        self.assertIn("Backfilled 1 images, 0 failed", out.getvalue())
+        self.assertIn("saved", out.getvalue())
+        self.assertFalse(os.path.exists(checkpoint))
+        self.assertEqual(ProductImage.objects.get(pk=shared[0].pk).image.name, old_names[0])
+
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("reencode_images", *args, stdout=out)
+        self.assertIn("Backfilled 2 images, 0 failed", out.getvalue())
+        first, second, legacy = ProductImage.objects.order_by("id")
+        # Files sharing a blob are re-encoded once and stay shared
+        self.assertNotEqual(first.image.name, old_names[0])
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(first.blob.image.name, first.image.name)
+        self.assertEqual(second.variants, first.variants)
+        self.assertNotEqual(legacy.image.name, old_names[1])
+        for name in old_names:
+            self.assertFalse(storage.exists(name))
+        for image in (first, legacy):
+            self.assertTrue(storage.exists(image.image.name))
+            self.assertTrue(storage.exists(image.variants["thumb"]["name"]))
+
+    def test_undecodable_image_is_marked_failed(self):
+        # Valid header, truncated pixel data: only the background decode fails
+        data = make_upload(size=(640, 480)).read()
+        upload = SimpleUploadedFile("cut.jpg", data[: len(data) * 3 // 4])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = manager_client().post(
+                "/api/products/", product_form([upload]), format="multipart"
+            )
+        self.assertEqual(response.status_code, 201)
+        with self.assertRaises(OSError):
+            callbacks[-1]()
+        self.assertEqual(ProductImage.objects.get().status, ProductImage.FAILED)
+
+    def test_unreadable_or_oversized_images_are_rejected(self):
+        not_an_image = SimpleUploadedFile("notes.jpg", b"not an image")
+        with override_settings(PRODUCT_IMAGE_MAX_PIXELS=1000):
+            response = manager_client().post(
+                "/api/products/",
+                product_form([not_an_image, make_upload("big.jpg")]),
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()["images"]), 2)
+        self.assertFalse(Product.objects.exists())
+
+    def test_large_upload_is_spooled_and_downscaled(self):
+        spool_dir = tempfile.mkdtemp()
+        with override_settings(
+            PRODUCT_IMAGE_MAX_DIMENSION=100,
+            FILE_UPLOAD_MAX_MEMORY_SIZE=1024,
+            FILE_UPLOAD_TEMP_DIR=spool_dir,
+        ):
+            with self.captureOnCommitCallbacks() as callbacks:
+                manager_client().post(
+                    "/api/products/",
+                    product_form([make_upload("photo.jpg", size=(640, 480))]),
+                    format="multipart",
+                )
+            # The request's own temp file is gone; the spooled copy waits for the worker
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+
+            callbacks[-1]()
+        self.assertEqual(os.listdir(spool_dir), [])
+        with ProductImage.objects.get().image.open() as fh:
+            self.assertEqual(Image.open(fh).size, (100, 75))
+
+
+@override_settings(PRODUCT_IMAGE_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp())
+class ImageDedupTests(TestCase):
+    def upload(self, *names):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = manager_client().post(
+                "/api/products/",
+                product_form([make_upload(name) for name in names]),
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 201)
+        return Product.objects.latest("id")
+
+    def test_repeat_upload_reuses_stored_image(self):
+        first = self.upload("front.jpg").images.get()
+
+        with patch("product.images.encode_webp") as encode, patch(
+            "django.core.files.storage.FileSystemStorage.save"
+        ) as save:
+            second = self.upload("front-copy.jpg").images.get()
+        encode.assert_not_called()
+        save.assert_not_called()
+
+        self.assertEqual(ImageBlob.objects.count(), 1)
+        self.assertEqual(second.status, ProductImage.READY)
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.variants, first.variants)
+        # bulk_create skipped the signal; the cover is set all the same
+        self.assertEqual(Product.objects.latest("id").cover_image_id, second.pk)
+
+    def test_blob_is_deleted_with_its_last_image(self):
+        first = self.upload("front.jpg")
+        second = self.upload("front.jpg")
+        blob = ImageBlob.objects.get()
+        storage = blob.image.storage
+
+        with self.assertRaises(ProtectedError):
+            blob.delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(ImageBlob.objects.exists())
+        self.assertTrue(storage.exists(blob.image.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(storage.exists(blob.image.name))
+        self.assertFalse(storage.exists(blob.variants["thumb"]["name"]))
+
+
+# Peak RSS (KB on Linux) of one encode_webp call in a fresh interpreter
+RSS_PROBE = """
+import resource, sys
+from product.images import encode_webp
+encode_webp(sys.argv[1], max_dimension=int(sys.argv[2]) or None)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+class ImageDecodeMemoryTests(SimpleTestCase):
+    def test_bounded_decode_of_48_megapixel_jpeg(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "48mp.jpg")
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    "import sys; from PIL import Image; "
+                    "Image.radial_gradient('L').resize((8000, 6000)).convert('RGB')"
+                    ".save(sys.argv[1], quality=90)",
+                    path,
+                ],
+                check=True,
+            )
+
+            def peak_rss(max_dimension):
+                result = subprocess.run(
+                    [sys.executable, "-c", RSS_PROBE, path, str(max_dimension)],
+                    cwd=settings.BASE_DIR,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                return int(result.stdout)
+
+            full = peak_rss(0)
+            bounded = peak_rss(2400)
+
+        # A full 48 MP RGB decode alone is ~144 MB
+        self.assertLess(bounded, full / 2, f"full {full} KB, bounded {bounded} KB")
+
+
+@unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run")
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductUploadBenchmark(TransactionTestCase):
+    photo_size = (3024, 4032)  # 12 MP phone photo
+    uploads = 0  # distinct images so content dedup never kicks in
+
+    def _upload(self, client, count):
+        self.uploads += count
+        images = [
+            make_upload(f"{n}.jpg", self.photo_size, marker=(n % 256, n // 256 % 256, 255))
+            for n in range(self.uploads - count, self.uploads)
+        ]
+        started = time.perf_counter()
+        response = client.post("/api/products/", product_form(images), format="multipart")
+        latency = time.perf_counter() - started
+        self.assertEqual(response.status_code, 201)
+
+        product = Product.objects.latest("id")
+        while product.images.filter(status=ProductImage.PROCESSING).exists():
+            time.sleep(0.05)
+        done = time.perf_counter() - started
+        self.assertFalse(product.images.exclude(status=ProductImage.READY).exists())
+        return latency, count / done
+
+    def test_one_vs_many_images(self):
+        client = manager_client()
+        for workers in (0, 4):
+            with override_settings(PRODUCT_IMAGE_WORKERS=workers):
+                self._upload(client, 1)  # warm up the pool
+                for count in (1, 8):
+                    latency, throughput = self._upload(client, count)
+                    print(
+                        f"\nworkers={workers} images={count}: POST {latency * 1000:.0f} ms, "
+                        f"{throughput:.1f} images/s until ready"
+                    )
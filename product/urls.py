@@ -1,11 +1,15 @@
 from django.urls import path
-from .views import ProductListCreateView, ProductDeleteView,ProductDetailView
+from .views import ProductListCreateView, ProductDeleteView,ProductDetailView,ProductSearchView,ProductImportView,ProductFacetsView,ProductFeedView
 from django.conf import settings
 from django.conf.urls.static import static
 
 
 urlpatterns = [
     path('products/', ProductListCreateView.as_view(), name='product-list-create'),
+    path('products/facets/', ProductFacetsView.as_view(), name='product-facets'),
+    path('products/import/', ProductImportView.as_view(), name='product-import'),
+    path('products/feed/<str:fmt>/', ProductFeedView.as_view(), name='product-feed'),
+    path('products/search/', ProductSearchView.as_view(), name='product-search'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
     path('products/delete/<int:pk>/', ProductDeleteView.as_view(), name='product-delete'),
 ]
@@ -1,14 +1,45 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from PIL import Image
 from .models import Product
-from .serializers import ProductSerializer
+from .serializers import (
+    ProductReadSerializer,
+    ProductSerializer,
+    ProductStockSerializer,
+    sparse_fields,
+    validate_unique_sizes,
+)
 from api.permissions import IsManagerOrReadOnly
+from .permissions import IsManagerOrFeedToken
+from .cache import (
+    bump_catalog_version,
+    cached_catalog_response,
+    get_product_detail,
+    get_product_details,
+    invalidate_product,
+)
+from .feeds import FEED_FORMATS, stream_feed
+from .filters import facet_counts, filter_products
+from .pagination import KeysetPagination
 import json
-from .models import Product, ProductImage, ProductStock
-from PIL import Image, ImageOps
-from django.core.files.base import ContentFile
-import io
+from cart.models import CartItem
+from .models import Product, ProductStock
+from .images import (
+    ImageTooLarge,
+    check_image,
+    create_product_images,
+    queue_image_conversions,
+)
+from .importer import FORMATS, import_catalog, open_text
+from .signals import stock_batch
 import os
 
 
@@ -16,11 +47,54 @@ class ProductListCreateView(APIView):
     permission_classes = [IsManagerOrReadOnly]
 
     def get(self, request):
-        products = Product.objects.filter(show=True).prefetch_related(
-            "stock_details", "images"
+        if "ids" in request.query_params:
+            return self.get_batch(request)
+        return cached_catalog_response(
+            request, lambda: JSONRenderer().render(self.get_list_data(request))
+        )
+
+    def get_batch(self, request):
+        """?ids=3,1,2: detail representations in request order, plus unknown ids.
+
+        Served from the per-product detail cache, so a cart or order page
+        costs one request and at most one query per missing portion.
+        """
+        try:
+            ids = [int(pk) for pk in request.query_params["ids"].split(",") if pk.strip()]
+        except ValueError:
+            raise ValidationError({"ids": "Must be a comma separated list of integers."})
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.PRODUCT_MAX_PAGE_SIZE:
+            raise ValidationError(
+                {"ids": f"At most {settings.PRODUCT_MAX_PAGE_SIZE} ids per request."}
+            )
+
+        products = get_product_details(ids)
+        return Response(
+            {
+                "results": [products[pk] for pk in ids if pk in products],
+                "missing": [pk for pk in ids if pk not in products],
+            }
         )
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+
+    def get_list_data(self, request):
+        fields = sparse_fields(request.query_params)
+        paginator = KeysetPagination(request)
+        products = filter_products(
+            Product.objects.filter(show=True), request.query_params
+        ).values(
+            *ProductReadSerializer.columns(fields),
+            *[f.lstrip("-") for f in paginator.fields],
+        )
+        if paginator.enabled:
+            page = paginator.paginate_queryset(products)
+            serializer = ProductReadSerializer(page, many=True, fields=fields)
+            return paginator.get_paginated_data(serializer.data)
+
+        # Same order as the paginated listing, so ?ordering= means the same thing
+        products = products.order_by(*paginator.fields)
+        serializer = ProductReadSerializer(products, many=True, fields=fields)
+        return serializer.data
 
     def post(self, request):
         data = request.data  # ❌ avoid .copy()
@@ -34,69 +108,248 @@ class ProductListCreateView(APIView):
                 {"stock_details": "Invalid JSON."}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Create Product
-        product = Product.objects.create(
-            name=data.get("name"),
-            description=data.get("description"),
-            price=data.get("price"),
-            category=data.get("category"),
-            subcategory=data.get("subcategory"),
-            bestseller=str(data.get("bestseller")).lower() == "true",
-        )
+        # Reject unreadable or oversized images before anything is written
+        errors = []
+        for image in images:
+            try:
+                check_image(image)
+            except (ImageTooLarge, Image.DecompressionBombError, OSError) as e:
+                errors.append(f"{image.name}: {e}")
+        if errors:
+            return Response({"images": errors}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Create ProductStock entries
-        for stock in stock_details:
-            ProductStock.objects.create(
-                product=product, size=stock["size"], quantity=stock["quantity"]
+        # Product, stock and stock totals commit together
+        with transaction.atomic():
+            product = Product.objects.create(
+                name=data.get("name"),
+                description=data.get("description"),
+                price=data.get("price"),
+                category=data.get("category"),
+                subcategory=data.get("subcategory"),
+                bestseller=str(data.get("bestseller")).lower() == "true",
             )
 
-        # Create ProductImage entries with WebP conversion
-        for image in images:
-            webp_image = self.convert_to_webp(image)
-            ProductImage.objects.create(product=product, image=webp_image)
+            # Create ProductStock entries
+            for stock in stock_details:
+                ProductStock.objects.create(
+                    product=product, size=stock["size"], quantity=stock["quantity"]
+                )
+
+            # New images start out PROCESSING; WebP conversion runs in the
+            # background pool once the rows are committed
+            jobs = create_product_images(product, images)
+            if jobs:
+                transaction.on_commit(lambda: queue_image_conversions(jobs))
 
         return Response("created", status=status.HTTP_201_CREATED)
 
-    def convert_to_webp(self, image_file):
-        # Open the image
-        img = Image.open(image_file)
-        
-        # Apply EXIF orientation (works for HEIC and all formats)
-        img = ImageOps.exif_transpose(img)
-        
-        # Convert to RGB if necessary
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        
-        # Create a BytesIO buffer
-        buffer = io.BytesIO()
-        
-        # Save as WebP
-        img.save(buffer, format='WEBP', quality=85, optimize=True)
-        buffer.seek(0)
-        
-        # Generate new filename
-        original_name = os.path.splitext(image_file.name)[0]
-        webp_filename = f"{original_name}.webp"
-        
-        return ContentFile(buffer.getvalue(), name=webp_filename)
+
+class ProductFacetsView(APIView):
+    permission_classes = [IsManagerOrReadOnly]
+
+    def get(self, request):
+        return cached_catalog_response(
+            request,
+            lambda: JSONRenderer().render(
+                facet_counts(
+                    filter_products(Product.objects.filter(show=True), request.query_params)
+                )
+            ),
+        )
+
+
+class ProductImportView(APIView):
+    permission_classes = [IsManagerOrReadOnly]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response(
+                {"file": "A CSV or JSONL file is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if upload.size > settings.PRODUCT_IMPORT_MAX_UPLOAD_SIZE:
+            # Keeps an import well inside one request's time budget
+            return Response(
+                {
+                    "file": (
+                        f"Files over {settings.PRODUCT_IMPORT_MAX_UPLOAD_SIZE} bytes must "
+                        "be imported with `manage.py import_catalog`."
+                    )
+                },
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        fmt = request.data.get("format") or os.path.splitext(upload.name)[1].lstrip(".").lower()
+        if fmt not in FORMATS:
+            return Response(
+                {"format": f"Must be one of: {', '.join(FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Decode as we go; large uploads are already spooled to disk by Django
+        report, _ = import_catalog(open_text(upload.file), fmt)
+        return Response(report)
+
+
+class ProductFeedView(APIView):
+    # Streams the whole catalog uncached, so it is not open to anonymous users
+    permission_classes = [IsManagerOrFeedToken]
+
+    def get(self, request, fmt):
+        if fmt not in FEED_FORMATS:
+            return Response(
+                {"detail": f"Format must be one of: {', '.join(FEED_FORMATS)}."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        response = StreamingHttpResponse(
+            stream_feed(
+                fmt,
+                chunk_size=settings.CATALOG_FEED_CHUNK_SIZE,
+                base_url=request.build_absolute_uri("/"),
+            ),
+            content_type=FEED_FORMATS[fmt],
+        )
+        response["Content-Disposition"] = f'attachment; filename="catalog.{fmt}"'
+        return response
+
+
+class ProductSearchView(APIView):
+    permission_classes = [IsManagerOrReadOnly]
+
+    def get(self, request):
+        q = request.query_params.get("q", "").strip()
+        if not q:
+            raise ValidationError({"q": "This query parameter is required."})
+        try:
+            page_size = int(request.query_params.get("page_size", settings.PRODUCT_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({"page_size": "Must be an integer."})
+        page_size = max(1, min(page_size, settings.PRODUCT_MAX_PAGE_SIZE))
+
+        # websearch syntax: quoted phrases, OR, -exclusions; never raises on user input
+        fields = sparse_fields(request.query_params)
+        query = SearchQuery(q, search_type="websearch", config="english")
+        products = (
+            filter_products(Product.objects.filter(show=True), request.query_params)
+            .filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "id")
+            .values(*ProductReadSerializer.columns(fields))[:page_size]
+        )
+        serializer = ProductReadSerializer(products, many=True, fields=fields)
+        return Response(serializer.data)
 
 
 class ProductDetailView(APIView):
     permission_classes = [IsManagerOrReadOnly]
 
     def get(self, request, pk):
+        product = get_product_detail(pk)
+        if product is None:
+            return Response(
+                {"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response(product)
+
+    def patch(self, request, pk):
         try:
-            product = Product.objects.prefetch_related("stock_details", "images").get(
-                pk=pk
+            product = (
+                Product.objects.select_related("cover_image")
+                .prefetch_related("stock_details", "images")
+                .get(pk=pk)
             )
         except Product.DoesNotExist:
             return Response(
                 {"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = ProductSerializer(product)
-        return Response(serializer.data)
+        data = request.data
+        scalars = {
+            key: data[key]
+            for key in ProductReadSerializer.columns()
+            if key in data and key != "id"
+        }
+        serializer = ProductSerializer(product, data=scalars, partial=True)
+        serializer.is_valid(raise_exception=True)
+
+        stock_details = data.get("stock_details")
+        if stock_details is not None:
+            # Multipart clients send it as a JSON string, like POST does
+            if isinstance(stock_details, str):
+                try:
+                    stock_details = json.loads(stock_details)
+                except json.JSONDecodeError:
+                    return Response(
+                        {"stock_details": "Invalid JSON."},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+            stock_serializer = ProductStockSerializer(data=stock_details, many=True)
+            stock_serializer.is_valid(raise_exception=True)
+            try:
+                validate_unique_sizes(stock_serializer.validated_data)
+            except ValidationError as e:
+                raise ValidationError({"stock_details": e.detail})
+            stock_details = {s["size"]: s["quantity"] for s in stock_serializer.validated_data}
+
+        with transaction.atomic():
+            changed = serializer.validated_data
+            for attr, value in changed.items():
+                setattr(product, attr, value)
+            if changed:
+                product.save(update_fields=list(changed))
+
+            stock = list(product.stock_details.all())
+            if stock_details is not None:
+                stock = self.apply_stock(product, stock, stock_details)
+
+        # Answer from memory: saved fields, prefetched images, upserted stock
+        response_data = ProductSerializer(product).data
+        response_data["stock_details"] = ProductStockSerializer(
+            sorted(stock, key=lambda s: s.pk), many=True
+        ).data
+        return Response(response_data)
+
+    def apply_stock(self, product, existing, submitted):
+        """Make the product's stock match ``submitted`` ({size: quantity}).
+
+        Changed and new sizes go in one INSERT ... ON CONFLICT (product, size)
+        DO UPDATE; sizes that were left out go in one DELETE, along with the
+        cart items for them (as ProductStock.delete does). Returns the
+        resulting rows.
+        """
+        current = {s.size: s for s in existing}
+        upserts = [
+            ProductStock(product=product, size=size, quantity=quantity)
+            for size, quantity in submitted.items()
+            if size not in current or current[size].quantity != quantity
+        ]
+        removed = [s for size, s in current.items() if size not in submitted]
+
+        if upserts:
+            ProductStock.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=["product", "size"],
+                update_fields=["quantity"],
+            )
+        if removed:
+            CartItem.objects.filter(
+                product_id=product, size__in=[s.size for s in removed]
+            ).delete()
+            # post_delete would refresh the totals once per removed size
+            with stock_batch():
+                ProductStock.objects.filter(pk__in=[s.pk for s in removed]).delete()
+        if upserts or removed:
+            # bulk_create and the batch above skip the stock receivers
+            Product.refresh_stock_totals([product.pk])
+            transaction.on_commit(bump_catalog_version)
+            transaction.on_commit(lambda: invalidate_product(product.pk, detail=False))
+
+        unchanged = [s for size, s in current.items() if submitted.get(size) == s.quantity]
+        return unchanged + upserts
 
 
 class ProductDeleteView(APIView):